@@ -0,0 +1,284 @@
+"""
+Async twins of the auth and task routes in main.py
+
+Used instead of the sync handlers when settings.async_db is on. Every handler
+is an ``async def`` on an AsyncSession (aiosqlite for SQLite), so requests no
+longer hold a worker thread while they wait on the database or on the
+password hashing pool.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response, status
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import User, Task
+import schemas
+import pagination
+import db_interaction
+import principal_cache
+import rate_limit
+from principal_cache import Principal
+import password_hashing
+import task_versions
+import task_json
+from authentication import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    oauth2_scheme,
+    create_access_token,
+    decode_access_token,
+)
+
+router = APIRouter()
+
+
+# Database dependency
+async def get_async_db(request: Request):
+    # Async database session - the session factory is built in the app's lifespan (main.py)
+    async with request.app.state.async_session_factory() as db:
+        yield db
+
+
+# User utilities
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
+
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
+
+
+async def get_user_task(db: AsyncSession, task_id: int, user_id: int) -> Optional[Task]:
+    result = await db.execute(select(Task).where(Task.id == task_id, Task.user_id == user_id, Task.deleted_at.is_(None)))
+    return result.scalars().first()
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> Principal:
+    # Served from the principal cache when possible - no token decode, no users query
+    principal = principal_cache.cache.get(token)
+    if principal is not None:
+        return principal
+
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    payload = decode_access_token(token)
+    if payload is None:
+        raise credentials_exception
+
+    user = await get_user_by_username(db, username=payload["sub"])
+    if user is None:
+        raise credentials_exception
+    return principal_cache.cache.put(token, user, payload["exp"])
+
+
+async def limit_task_creation(request: Request, current_user: Principal = Depends(get_current_user)) -> None:
+    # Per user - get_current_user is resolved once per request, so this costs no extra lookup
+    request.app.state.rate_limiters["create_task_user"].check(current_user.id)
+
+
+async def limit_bulk_task_creation(request: Request, current_user: Principal = Depends(get_current_user)) -> None:
+    # /tasks/bulk and /tasks/import - a limit of their own, one of them may write thousands of rows
+    request.app.state.rate_limiters["bulk_task_user"].check(current_user.id)
+
+
+def _cache_headers(etag: str) -> dict:
+    # Clients may keep task reads but must revalidate them (If-None-Match) before reuse
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+# ============================================================================
+# ROUTES
+# ============================================================================
+
+@router.post("/register", response_model=schemas.User, status_code=status.HTTP_201_CREATED,
+             dependencies=[Depends(rate_limit.limit_register)])
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    """Register a new user"""
+    if await get_user_by_username(db, username=user.username):
+        raise HTTPException(status_code=400, detail="Username already registered")
+    if await get_user_by_email(db, email=user.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
+
+    hashed_password = await password_hashing.hash_password_async(user.password)
+    # One INSERT ... RETURNING instead of INSERT, commit and a refresh SELECT
+    stmt = (
+        insert(User)
+        .values(username=user.username, email=user.email, hashed_password=hashed_password)
+        .returning(User.id, User.username, User.email)
+    )
+    db_user = (await db.execute(stmt)).one()
+    await db.commit()
+    return db_user
+
+
+@router.post("/login", response_model=schemas.Token, dependencies=[Depends(rate_limit.limit_login)])
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    """Login and get access token"""
+    user = await get_user_by_username(db, form_data.username)
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await password_hashing.verify_and_update_async(form_data.password, user.hashed_password)
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if new_hash:
+        # Stored hash is below the current hashing policy - replace it while we know the password
+        user.hashed_password = new_hash
+        await db.commit()
+
+    access_token = create_access_token(
+        data={"sub": user.username}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {"access_token": access_token, "token_type": "bearer"}
+
+
+@router.get("/users/me", response_model=schemas.User)
+async def read_users_me(current_user: Principal = Depends(get_current_user)):
+    """Get current user information"""
+    return current_user
+
+
+# Task endpoints
+@router.post("/tasks", response_model=schemas.Task, status_code=status.HTTP_201_CREATED,
+             dependencies=[Depends(limit_task_creation)])
+async def create_task(
+        task: schemas.TaskCreate,
+        current_user: Principal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """Create a new task"""
+    return await db.run_sync(db_interaction.create_task, task, current_user.id)
+
+
+@router.post("/tasks/bulk", response_model=schemas.TaskBulkCreated, status_code=status.HTTP_201_CREATED,
+             dependencies=[Depends(limit_bulk_task_creation)])
+async def create_tasks_bulk(
+        tasks: list[schemas.TaskCreate] = Body(..., min_length=1, max_length=schemas.MAX_BULK_TASKS),
+        current_user: Principal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """Create many tasks in one transaction and return their ids in request order"""
+    ids = await db.run_sync(db_interaction.create_tasks_bulk, tasks, current_user.id)
+    return {"ids": ids}
+
+
+@router.get("/tasks", response_model=list[schemas.Task])
+async def read_tasks(
+        request: Request,
+        limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        status_filter: Optional[schemas.StatusEnum] = Query(None, alias="status"),
+        due_before: Optional[datetime] = None,
+        due_after: Optional[datetime] = None,
+        sort: schemas.TaskSort = schemas.TaskSort.id,
+        current_user: Principal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """Get one page of tasks for current user - the next page cursor is sent in the X-Next-Cursor header"""
+    version = await db.run_sync(task_versions.current, current_user.id)
+    etag = task_versions.list_etag(current_user.id, version, request.url.query)
+    if task_versions.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_cache_headers(etag))
+    headers = _cache_headers(etag)
+
+    after = None
+    if cursor:
+        try:
+            after = pagination.decode_cursor(cursor, sort)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    stmt = pagination.task_page_statement(
+        current_user.id, limit, sort=sort, after=after,
+        status=status_filter, due_before=due_before, due_after=due_after,
+    )
+    rows = (await db.execute(task_json.task_columns(stmt))).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = pagination.encode_cursor(sort, rows[-1])
+    return task_json.task_list_response(rows, headers)
+
+
+@router.get("/tasks/{task_id}", response_model=schemas.Task)
+async def read_task(
+        task_id: int,
+        request: Request,
+        response: Response,
+        current_user: Principal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """Get a specific task"""
+    version = await db.run_sync(task_versions.current, current_user.id)
+    etag = task_versions.task_etag(current_user.id, version, task_id)
+    if_none_match = request.headers.get("if-none-match")
+    if task_versions.etag_matches(if_none_match, etag, exists=False):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_cache_headers(etag))
+
+    task = await get_user_task(db, task_id, current_user.id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if task_versions.etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_cache_headers(etag))
+    response.headers.update(_cache_headers(etag))
+    return task
+
+
+@router.patch("/tasks/status", response_model=schemas.TaskBulkResult)
+async def update_status_bulk(
+        bulk_update: schemas.TaskBulkStatusUpdate,
+        current_user: Principal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """Update the status of every task matching the filter"""
+    affected = await db.run_sync(
+        db_interaction.update_tasks_status, bulk_update.filter, bulk_update.status, current_user.id
+    )
+    return {"affected": affected}
+
+
+@router.delete("/tasks", response_model=schemas.TaskBulkResult)
+async def delete_tasks_bulk(
+        task_filter: schemas.TaskFilter,
+        current_user: Principal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """Delete every task matching the filter"""
+    affected = await db.run_sync(db_interaction.delete_tasks, task_filter, current_user.id)
+    return {"affected": affected}
+
+
+@router.patch("/tasks/{task_id}/status", response_model=schemas.Task)
+async def update_status(
+        task_id: int,
+        status_update: schemas.TaskUpdateStatus,
+        current_user: Principal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """Update task status"""
+    task = await db.run_sync(db_interaction.update_task_status, task_id, status_update.status, current_user.id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task
+
+
+@router.delete("/tasks/{task_id}")
+async def delete_task(
+        task_id: int,
+        current_user: Principal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """Delete a task"""
+    task = await db.run_sync(db_interaction.delete_task, task_id, current_user.id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return {"detail": "Task deleted"}
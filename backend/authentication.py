@@ -1,43 +1,31 @@
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from database import SessionLocal
-import schemas
+import password_hashing
 from models import User
 
-# Configuration
-SECRET_KEY = "Might add one later "
+# Configuration - shared by the sync and async routes in main.py / async_routes.py
+SECRET_KEY = "no need to add a key - only a test app"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
-def get_db():
-    #  Get database session
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    #  Verify a password against its hash - runs on the password hashing pool
+    return password_hashing.verify_password(plain_password, hashed_password)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    #  Verify a password against its hash
-    return pwd_context.verify(plain_password, hashed_password)
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    #  Verify a password and, if its hash is below the hashing policy, rehash it - (valid, new hash or None)
+    return password_hashing.verify_and_update(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    #  Hash a password (truncate to 72 bytes for bcrypt)
-    #  Bcrypt has a 72 byte limit
-    password_bytes = password.encode('utf-8')[:72]
-    truncated_password = password_bytes.decode('utf-8', errors='ignore')
-    return pwd_context.hash(truncated_password)
+    #  Hash a password - runs on the password hashing pool
+    return password_hashing.hash_password(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -48,10 +36,26 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    #  jose pulls in cryptography - imported on first use to keep it out of the app's startup
+    from jose import jwt
+
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
+def decode_access_token(token: str) -> Optional[dict]:
+    #  Claims of a valid token carrying a username (sub), None if the token is invalid or expired
+    from jose import JWTError, jwt
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("sub") is None:
+        return None
+    return payload
+
+
 def get_user_by_username(db: Session, username: str) -> Optional[User]:
     # Get user by username
     return db.query(User).filter(User.username == username).first()
@@ -67,29 +71,12 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[Use
     user = get_user_by_username(db, username)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = verify_and_update_password(password, user.hashed_password)
+    if not valid:
         return None
-    return user
-
-
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-    #  Get current authenticated user from token
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-
-    user = get_user_by_username(db, username=token_data.username)
-    if user is None:
-        raise credentials_exception
+    if new_hash:
+        #  Stored hash is below the current hashing policy - replace it while we know the password
+        user.hashed_password = new_hash
+        db.commit()
     return user
 
@@ -0,0 +1,441 @@
+"""
+In-process load test of the API
+
+Drives main.app through httpx.AsyncClient on an ASGI transport - no server and
+no network in between, so the numbers measure the application and the
+database. Every scenario reports its throughput and p50/p95/p99 latency, also
+per endpoint; the results are written as JSON and can be compared against a
+stored baseline.
+
+Scenarios:
+    login_storm  - many concurrent logins of the same user (password hashing pool)
+    list_reads   - paging through a large task list with filters and sort orders
+    mixed_crud   - create / read / status update / delete mix
+    bulk_users   - several users with 10k tasks each: bulk inserts, then list, stats and search reads
+    cold_start   - fresh interpreters importing main: the start-up cost of every worker and test run
+
+Unless --database-url is given, the run uses a fresh SQLite database in a
+temporary directory.
+
+Usage:
+    python benchmark.py                                   # results in benchmark_results.json
+    python benchmark.py --scenario list_reads --quick
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json   # exit code 1 on a regression
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+STATUSES = ("pending", "in_progress", "completed")
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Run in a fresh interpreter - prints the seconds `import main` took
+COLD_START_CODE = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+@dataclass
+class Options:
+    concurrency: int = 32
+    logins: int = 200
+    list_tasks: int = 5000
+    list_requests: int = 1000
+    crud_operations: int = 2000
+    bulk_users: int = 5
+    bulk_tasks_per_user: int = 10000
+    cold_starts: int = 20
+    seed: int = 42
+
+    def quick(self) -> "Options":
+        # A tenth of the work - a smoke test rather than a measurement
+        return Options(
+            concurrency=self.concurrency,
+            logins=max(self.logins // 10, 1),
+            list_tasks=max(self.list_tasks // 10, 1),
+            list_requests=max(self.list_requests // 10, 1),
+            crud_operations=max(self.crud_operations // 10, 1),
+            bulk_users=max(self.bulk_users // 5, 1),
+            bulk_tasks_per_user=max(self.bulk_tasks_per_user // 10, 1),
+            cold_starts=max(self.cold_starts // 4, 1),
+            seed=self.seed,
+        )
+
+
+# ============================================================================
+# MEASUREMENT
+# ============================================================================
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def summarize(latencies: list[float], errors: int, duration: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(ordered) / duration, 1) if duration > 0 else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+    }
+
+
+class Recorder:
+    # Latency of every measured request, grouped by endpoint label
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.started = time.perf_counter()
+
+    async def request(self, client: httpx.AsyncClient, label: str, method: str, url: str,
+                      expected: tuple = (200,), **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies.setdefault(label, []).append(time.perf_counter() - start)
+        if response.status_code not in expected:
+            self.errors[label] = self.errors.get(label, 0) + 1
+        return response
+
+    def result(self) -> dict:
+        duration = time.perf_counter() - self.started
+        everything = [latency for latencies in self.latencies.values() for latency in latencies]
+        result = summarize(everything, sum(self.errors.values()), duration)
+        result["endpoints"] = {
+            label: summarize(latencies, self.errors.get(label, 0), duration)
+            for label, latencies in sorted(self.latencies.items())
+        }
+        return result
+
+
+async def run_concurrently(count: int, concurrency: int, job: Callable[[int], Awaitable[None]]) -> None:
+    # Run job(0) .. job(count - 1) with at most `concurrency` in flight
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(i: int):
+        async with semaphore:
+            await job(i)
+
+    await asyncio.gather(*(limited(i) for i in range(count)))
+
+
+# ============================================================================
+# SETUP HELPERS - not measured
+# ============================================================================
+
+async def create_user(client: httpx.AsyncClient, name: str) -> dict:
+    password = f"{name}-password"
+    response = await client.post(
+        "/register", json={"username": name, "email": f"{name}@bench.example.com", "password": password}
+    )
+    response.raise_for_status()
+    response = await client.post("/login", data={"username": name, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def task_rows(count: int, rng: random.Random, prefix: str = "Task") -> list[dict]:
+    now = datetime.now()
+    return [
+        {
+            "title": f"{prefix} {i} {rng.choice(('report', 'invoice', 'meeting', 'review', 'deploy'))}",
+            "description": f"Generated by the benchmark - {rng.choice(('urgent', 'later', 'blocked', 'optional'))}",
+            "status": rng.choice(STATUSES),
+            "due_date": (now + timedelta(days=rng.randint(-30, 60), minutes=i)).isoformat(),
+        }
+        for i in range(count)
+    ]
+
+
+async def insert_tasks(client: httpx.AsyncClient, headers: dict, rows: list[dict],
+                       recorder: Optional[Recorder] = None) -> list[int]:
+    # POST /tasks/bulk in batches of 1000 (schemas.MAX_BULK_TASKS)
+    ids = []
+    for start in range(0, len(rows), 1000):
+        batch = rows[start:start + 1000]
+        if recorder is None:
+            response = await client.post("/tasks/bulk", json=batch, headers=headers)
+            response.raise_for_status()
+        else:
+            response = await recorder.request(
+                client, "POST /tasks/bulk", "POST", "/tasks/bulk", expected=(201,), json=batch, headers=headers
+            )
+        ids += response.json()["ids"]
+    return ids
+
+
+# ============================================================================
+# SCENARIOS
+# ============================================================================
+
+async def login_storm(client: httpx.AsyncClient, options: Options) -> dict:
+    await create_user(client, "storm")
+    recorder = Recorder()
+
+    async def login(i: int):
+        # 503 means the hashing pool shed the request - counted as an error
+        await recorder.request(
+            client, "POST /login", "POST", "/login",
+            data={"username": "storm", "password": "storm-password"},
+        )
+
+    await run_concurrently(options.logins, options.concurrency, login)
+    return recorder.result()
+
+
+async def list_reads(client: httpx.AsyncClient, options: Options) -> dict:
+    rng = random.Random(options.seed)
+    headers = await create_user(client, "reader")
+    await insert_tasks(client, headers, task_rows(options.list_tasks, rng))
+    queries = ["limit=100", "limit=100&sort=due_date", "limit=100&status=pending", "limit=500"]
+    recorder = Recorder()
+
+    async def read_pages(i: int):
+        # Start a fresh listing, or follow the cursor a few pages deep
+        query = queries[i % len(queries)]
+        response = await recorder.request(client, "GET /tasks", "GET", f"/tasks?{query}", headers=headers)
+        for _ in range(i % 3):
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor:
+                break
+            response = await recorder.request(
+                client, "GET /tasks", "GET", f"/tasks?{query}&cursor={cursor}", headers=headers
+            )
+
+    # Every call issues one to three requests - stop once roughly list_requests were made
+    await run_concurrently(max(options.list_requests // 2, 1), options.concurrency, read_pages)
+    return recorder.result()
+
+
+async def mixed_crud(client: httpx.AsyncClient, options: Options) -> dict:
+    rng = random.Random(options.seed)
+    headers = await create_user(client, "crud")
+    live_ids = await insert_tasks(client, headers, task_rows(500, rng))
+    recorder = Recorder()
+    # Operations are drawn up front so the mix does not depend on scheduling
+    operations = rng.choices(["create", "read", "update", "delete"], weights=[40, 30, 20, 10], k=options.crud_operations)
+    rows = task_rows(options.crud_operations, rng, prefix="Crud")
+
+    async def operate(i: int):
+        operation = operations[i]
+        if operation == "create" or not live_ids:
+            response = await recorder.request(
+                client, "POST /tasks", "POST", "/tasks", expected=(201,), json=rows[i], headers=headers
+            )
+            if response.status_code == 201:
+                live_ids.append(response.json()["id"])
+        # A concurrent delete may remove the task first - 404 is a valid outcome for reads and updates
+        elif operation == "read":
+            task_id = rng.choice(live_ids)
+            await recorder.request(
+                client, "GET /tasks/{id}", "GET", f"/tasks/{task_id}", expected=(200, 404), headers=headers
+            )
+        elif operation == "update":
+            task_id = rng.choice(live_ids)
+            await recorder.request(
+                client, "PATCH /tasks/{id}/status", "PATCH", f"/tasks/{task_id}/status",
+                expected=(200, 404), json={"status": rng.choice(STATUSES)}, headers=headers,
+            )
+        else:
+            task_id = live_ids.pop(rng.randrange(len(live_ids)))
+            await recorder.request(client, "DELETE /tasks/{id}", "DELETE", f"/tasks/{task_id}", headers=headers)
+
+    await run_concurrently(options.crud_operations, options.concurrency, operate)
+    return recorder.result()
+
+
+async def bulk_users(client: httpx.AsyncClient, options: Options) -> dict:
+    rng = random.Random(options.seed)
+    users = [await create_user(client, f"bulk{i}") for i in range(options.bulk_users)]
+    recorder = Recorder()
+
+    async def fill(i: int):
+        await insert_tasks(client, users[i], task_rows(options.bulk_tasks_per_user, rng), recorder)
+
+    await run_concurrently(len(users), options.concurrency, fill)
+
+    reads = [
+        ("GET /tasks", "/tasks?limit=100"),
+        ("GET /tasks", "/tasks?limit=100&sort=due_date&status=in_progress"),
+        ("GET /tasks/stats", "/tasks/stats"),
+        ("GET /tasks/search", "/tasks/search?q=report%20urgent&limit=50"),
+        ("GET /tasks/changes", "/tasks/changes?limit=500"),
+    ]
+
+    async def read(i: int):
+        label, url = reads[i % len(reads)]
+        await recorder.request(client, label, "GET", url, headers=users[i % len(users)])
+
+    await run_concurrently(len(users) * len(reads) * 20, options.concurrency, read)
+    return recorder.result()
+
+
+async def cold_start(client: httpx.AsyncClient, options: Options) -> dict:
+    # One interpreter at a time, so they do not compete for the CPU - the client is not used
+    latencies = {"import main": [], "process": []}
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(options.cold_starts):
+        start = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", COLD_START_CODE, cwd=BACKEND_DIR,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await process.communicate()
+        elapsed = time.perf_counter() - start
+        if process.returncode != 0:
+            errors += 1
+            continue
+        latencies["import main"].append(float(stdout.split()[-1]))
+        latencies["process"].append(elapsed)
+    duration = time.perf_counter() - started
+    result = summarize(latencies["import main"], errors, duration)
+    result["endpoints"] = {label: summarize(values, 0, duration) for label, values in latencies.items()}
+    return result
+
+
+SCENARIOS = {
+    "login_storm": login_storm,
+    "list_reads": list_reads,
+    "mixed_crud": mixed_crud,
+    "bulk_users": bulk_users,
+    "cold_start": cold_start,
+}
+
+
+# ============================================================================
+# BASELINES
+# ============================================================================
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    # Regressions of every scenario present in both runs - lower throughput or higher tail latency
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {current['throughput_rps']} rps, baseline {previous['throughput_rps']} rps"
+            )
+        for key in ("p95_ms", "p99_ms"):
+            if current[key] > previous[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {current[key]}, baseline {previous[key]}")
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}: {current['errors']} errors, baseline {previous['errors']}")
+    return regressions
+
+
+# ============================================================================
+# RUNNER
+# ============================================================================
+
+async def run(scenarios: list[str], options: Options) -> dict:
+    # Imported here so the database url is set before the app reads its settings
+    from main import app
+    import password_hashing
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "options": options.__dict__,
+        "scenarios": {},
+    }
+    transport = httpx.ASGITransport(app=app)
+    try:
+        # The ASGI transport does not run the lifespan, which builds the engine and the schema
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+                for name in scenarios:
+                    print(f"running {name} ...", flush=True)
+                    results["scenarios"][name] = await SCENARIOS[name](client, options)
+    finally:
+        password_hashing.pool.shutdown()
+    return results
+
+
+def print_results(results: dict) -> None:
+    print(f"\n{'scenario / endpoint':<34}{'requests':>9}{'errors':>8}{'rps':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, result in results["scenarios"].items():
+        rows = [(name, result)] + [(f"  {label}", stats) for label, stats in result["endpoints"].items()]
+        for label, stats in rows:
+            print(f"{label:<34}{stats['requests']:>9}{stats['errors']:>8}{stats['throughput_rps']:>10}"
+                  f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="In-process load test of the Task Manager API")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="scenario to run, may be repeated (default: all)")
+    parser.add_argument("--quick", action="store_true", help="a tenth of the work, for smoke tests")
+    parser.add_argument("--concurrency", type=int, default=Options.concurrency)
+    parser.add_argument("--database-url", help="database to run against (default: a temporary SQLite file)")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the results")
+    parser.add_argument("--baseline", help="baseline results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative slowdown before a difference counts as a regression")
+    parser.add_argument("--save-baseline", help="also write the results to this baseline file")
+    args = parser.parse_args()
+
+    options = Options(concurrency=args.concurrency)
+    if args.quick:
+        options = options.quick()
+
+    # Every request comes from one client - the rate limits would turn the load into 429s
+    os.environ.setdefault("TASKMANAGER_RATE_LIMIT_ENABLED", "false")
+    temp_dir = None
+    if args.database_url:
+        os.environ["TASKMANAGER_DATABASE_URL"] = args.database_url
+    else:
+        temp_dir = tempfile.mkdtemp(prefix="taskmanager-bench-")
+        os.environ["TASKMANAGER_DATABASE_URL"] = f"sqlite:///{os.path.join(temp_dir, 'bench.db')}"
+    try:
+        results = asyncio.run(run(args.scenario or list(SCENARIOS), options))
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    print_results(results)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nresults written to {args.output}")
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS against " + args.baseline)
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nno regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
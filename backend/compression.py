@@ -0,0 +1,192 @@
+"""
+Response compression
+
+CompressionMiddleware compresses responses with the best coding the client
+accepts (Accept-Encoding): zstd (needs the optional zstandard package), br
+(needs brotli) or gzip. A response is left alone when it is:
+
+    - smaller than settings.compression_min_size
+    - already encoded (Content-Encoding set - e.g. the precompressed frontend)
+    - not a text-like content type (images, archives), or a text/event-stream,
+      whose events must reach the client as they are sent
+
+Levels favour speed: task lists are repetitive JSON, and the low levels
+already get most of the ~10x; the higher ones cost far more CPU per request.
+Single-body responses are compressed in one go (in a worker thread when
+large); streamed ones (the task export) chunk by chunk. The ETag of a
+compressed response is made weak, as the bytes differ from the identity
+representation - If-None-Match compares weakly, so 304s keep working.
+"""
+import zlib
+from functools import lru_cache
+from typing import Callable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from config import Settings, settings
+from static_assets import accepted_encodings
+
+# Compressed inline below this size, in a worker thread above it
+THREAD_MIN_SIZE = 128 * 1024
+
+_COMPRESSIBLE_TYPES = {
+    "application/json", "application/x-ndjson", "application/javascript", "application/xml",
+    "image/svg+xml",
+}
+_NOT_COMPRESSED_STATUSES = {204, 206, 304}
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    if media_type == "text/event-stream":
+        return False
+    return media_type.startswith("text/") or media_type in _COMPRESSIBLE_TYPES or media_type.endswith("+json")
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = self.stream()
+        return compressor.compress(data) + compressor.flush()
+
+    def stream(self):
+        # wbits=31 - gzip container
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+
+class _Brotli:
+    def __init__(self, module, quality: int):
+        self.module, self.quality = module, quality
+
+    def compress(self, data: bytes) -> bytes:
+        return self.module.compress(data, quality=self.quality)
+
+    def stream(self):
+        compressor = self.module.Compressor(quality=self.quality)
+        # Same compress / flush interface as zlib
+        return _StreamAdapter(compressor.process, compressor.finish)
+
+
+class _Zstd:
+    def __init__(self, module, level: int):
+        self.module, self.level = module, level
+
+    def compress(self, data: bytes) -> bytes:
+        return self.module.ZstdCompressor(level=self.level).compress(data)
+
+    def stream(self):
+        compressor = self.module.ZstdCompressor(level=self.level).compressobj()
+        return _StreamAdapter(compressor.compress, compressor.flush)
+
+
+class _StreamAdapter:
+    def __init__(self, compress: Callable[[bytes], bytes], flush: Callable[[], bytes]):
+        self.compress, self.flush = compress, flush
+
+
+@lru_cache(maxsize=None)
+def codecs(zstd_level: int, brotli_quality: int, gzip_level: int) -> dict:
+    # Available codings, most preferred first - the optional packages are looked up once per set of levels
+    available = {}
+    try:
+        import zstandard
+
+        available["zstd"] = _Zstd(zstandard, zstd_level)
+    except ImportError:
+        pass
+    try:
+        import brotli
+
+        available["br"] = _Brotli(brotli, brotli_quality)
+    except ImportError:
+        pass
+    available["gzip"] = _Gzip(gzip_level)
+    return available
+
+
+def choose_encoding(accept_encoding: str, available: dict) -> Optional[str]:
+    accepted = accepted_encodings(accept_encoding)
+    return next((encoding for encoding in available if encoding in accepted), None)
+
+
+class CompressionMiddleware:
+    # Pure ASGI middleware - holds back the response start until it knows whether to compress
+    def __init__(self, app, app_settings: Optional[Settings] = None, minimum_size: Optional[int] = None):
+        self.app = app
+        app_settings = app_settings or settings
+        self.minimum_size = app_settings.compression_min_size if minimum_size is None else minimum_size
+        self.codecs = codecs(
+            app_settings.compression_zstd_level, app_settings.compression_brotli_quality,
+            app_settings.compression_gzip_level,
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), self.codecs)
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if (
+                    message["status"] in _NOT_COMPRESSED_STATUSES
+                    or "content-encoding" in headers
+                    or not is_compressible(headers.get("content-type", ""))
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                # First body message - decide for the whole response
+                headers = MutableHeaders(raw=start_message["headers"])
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                headers.add_vary_header("Accept-Encoding")
+                if encoding is None:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                headers["Content-Encoding"] = encoding
+                if "etag" in headers and not headers["etag"].startswith("W/"):
+                    headers["ETag"] = "W/" + headers["etag"]
+                codec = self.codecs[encoding]
+                if not more_body:
+                    if len(body) >= THREAD_MIN_SIZE:
+                        body = await run_in_threadpool(codec.compress, body)
+                    else:
+                        body = codec.compress(body)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                # Streamed - the length is not known up front
+                del headers["Content-Length"]
+                compressor = codec.stream()
+                await send(start_message)
+            chunk = compressor.compress(body)
+            if not more_body:
+                chunk += compressor.flush()
+            if chunk or not more_body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,173 @@
+"""
+Application settings
+
+Every setting has a default that works for local development and can be
+overridden with a TASKMANAGER_* environment variable.
+"""
+import os
+from dataclasses import dataclass
+
+_REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return default if value is None else int(value)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return default if value is None else float(value)
+
+
+@dataclass
+class Settings:
+    # Database - any SQLAlchemy url, plus connection pool sizing (ignored for in-memory SQLite)
+    database_url: str = "sqlite:///./tasks.db"
+    # Create / upgrade the schema when the app starts; turn off once "python main.py init-db" runs on deploy
+    init_db_on_startup: bool = True
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    # SQLite connection profile - applied to every new connection
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_cache_size_kib: int = 20000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_temp_store: str = "MEMORY"
+    # Serve the auth and task routes with async handlers on an async engine (aiosqlite for SQLite)
+    async_db: bool = False
+    # Password hashing process pool - worker processes, jobs allowed to wait, seconds before giving up
+    password_hash_workers: int = min(os.cpu_count() or 1, 4)
+    password_hash_queue_size: int = 16
+    password_hash_timeout: float = 5.0
+    # Password hashing policy - "bcrypt" (cost = rounds) or "argon2" (needs argon2-cffi; time cost,
+    # memory cost in KiB, parallelism). Hashes below the policy are replaced on the next login.
+    password_hash_scheme: str = "bcrypt"
+    bcrypt_rounds: int = 12
+    argon2_time_cost: int = 3
+    argon2_memory_cost: int = 65536
+    argon2_parallelism: int = 4
+    # Authenticated principal cache - seconds an entry may be reused (0 disables), max entries
+    principal_cache_ttl: float = 60.0
+    principal_cache_size: int = 10000
+    # Rate limits per route and key - "<count>/<second|minute|hour|day>", empty for no limit -
+    # and the number of buckets kept per limit before the least recently used are dropped
+    rate_limit_enabled: bool = True
+    rate_limit_login_ip: str = "30/minute"
+    rate_limit_login_username: str = "10/minute"
+    rate_limit_register_ip: str = "10/minute"
+    rate_limit_create_task_user: str = "120/minute"
+    # /tasks/bulk and /tasks/import calls - each can write many rows
+    rate_limit_bulk_task_user: str = "10/minute"
+    rate_limit_buckets: int = 100000
+    # POST /tasks/import commits after every this many valid rows
+    import_chunk_size: int = 1000
+    # GET /tasks/events - seconds between heartbeats, client reconnect delay, events kept per user
+    # for Last-Event-ID resume, events buffered per connection before it is told to reset,
+    # seconds a user's events are kept once they have no open stream
+    sse_heartbeat_seconds: float = 15.0
+    sse_retry_ms: int = 3000
+    sse_history_size: int = 1000
+    sse_queue_size: int = 1000
+    sse_history_ttl: float = 600.0
+    # Response compression - zstd / br when their packages are installed, else gzip; responses
+    # below compression_min_size bytes are sent as they are. Levels are tuned for JSON task lists.
+    compression_enabled: bool = True
+    compression_min_size: int = 1024
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 5
+    compression_zstd_level: int = 3
+    # Serve the frontend under /app - built (hashed names, precompressed variants) from frontend_dir
+    # into frontend_build_dir on startup when the build is out of date
+    serve_frontend: bool = True
+    frontend_dir: str = os.path.join(_REPO_DIR, "frontend")
+    frontend_build_dir: str = os.path.join(_REPO_DIR, "build", "frontend")
+    # Serve Prometheus metrics at /metrics, timing every request and database statement
+    metrics_enabled: bool = True
+    # Per-request query accounting (Server-Timing header, N+1 warnings), statements slower than
+    # slow_query_ms are logged with their query plan (0 disables), N+1 warning after this many repeats
+    query_accounting: bool = True
+    slow_query_ms: float = 100.0
+    n_plus_one_threshold: int = 10
+    # Request profiling - requests sending X-Profile: <profile_token>, plus a random sample of the
+    # rest, are stack-sampled every profile_interval_ms; the newest profile_keep profiles are kept
+    profiling_enabled: bool = False
+    profile_token: str = ""
+    profile_sample_rate: float = 0.0
+    profile_interval_ms: float = 5.0
+    profile_dir: str = "./profiles"
+    profile_keep: int = 50
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            database_url=os.getenv("TASKMANAGER_DATABASE_URL", cls.database_url),
+            init_db_on_startup=_env_bool("TASKMANAGER_INIT_DB_ON_STARTUP", cls.init_db_on_startup),
+            db_pool_size=_env_int("TASKMANAGER_DB_POOL_SIZE", cls.db_pool_size),
+            db_max_overflow=_env_int("TASKMANAGER_DB_MAX_OVERFLOW", cls.db_max_overflow),
+            db_pool_timeout=_env_float("TASKMANAGER_DB_POOL_TIMEOUT", cls.db_pool_timeout),
+            sqlite_journal_mode=os.getenv("TASKMANAGER_SQLITE_JOURNAL_MODE", cls.sqlite_journal_mode),
+            sqlite_synchronous=os.getenv("TASKMANAGER_SQLITE_SYNCHRONOUS", cls.sqlite_synchronous),
+            sqlite_busy_timeout_ms=_env_int("TASKMANAGER_SQLITE_BUSY_TIMEOUT_MS", cls.sqlite_busy_timeout_ms),
+            sqlite_cache_size_kib=_env_int("TASKMANAGER_SQLITE_CACHE_SIZE_KIB", cls.sqlite_cache_size_kib),
+            sqlite_mmap_size=_env_int("TASKMANAGER_SQLITE_MMAP_SIZE", cls.sqlite_mmap_size),
+            sqlite_temp_store=os.getenv("TASKMANAGER_SQLITE_TEMP_STORE", cls.sqlite_temp_store),
+            async_db=_env_bool("TASKMANAGER_ASYNC_DB", cls.async_db),
+            password_hash_workers=_env_int("TASKMANAGER_PASSWORD_HASH_WORKERS", cls.password_hash_workers),
+            password_hash_queue_size=_env_int("TASKMANAGER_PASSWORD_HASH_QUEUE_SIZE", cls.password_hash_queue_size),
+            password_hash_timeout=_env_float("TASKMANAGER_PASSWORD_HASH_TIMEOUT", cls.password_hash_timeout),
+            password_hash_scheme=os.getenv("TASKMANAGER_PASSWORD_HASH_SCHEME", cls.password_hash_scheme),
+            bcrypt_rounds=_env_int("TASKMANAGER_BCRYPT_ROUNDS", cls.bcrypt_rounds),
+            argon2_time_cost=_env_int("TASKMANAGER_ARGON2_TIME_COST", cls.argon2_time_cost),
+            argon2_memory_cost=_env_int("TASKMANAGER_ARGON2_MEMORY_COST", cls.argon2_memory_cost),
+            argon2_parallelism=_env_int("TASKMANAGER_ARGON2_PARALLELISM", cls.argon2_parallelism),
+            principal_cache_ttl=_env_float("TASKMANAGER_PRINCIPAL_CACHE_TTL", cls.principal_cache_ttl),
+            principal_cache_size=_env_int("TASKMANAGER_PRINCIPAL_CACHE_SIZE", cls.principal_cache_size),
+            rate_limit_enabled=_env_bool("TASKMANAGER_RATE_LIMIT_ENABLED", cls.rate_limit_enabled),
+            rate_limit_login_ip=os.getenv("TASKMANAGER_RATE_LIMIT_LOGIN_IP", cls.rate_limit_login_ip),
+            rate_limit_login_username=os.getenv("TASKMANAGER_RATE_LIMIT_LOGIN_USERNAME", cls.rate_limit_login_username),
+            rate_limit_register_ip=os.getenv("TASKMANAGER_RATE_LIMIT_REGISTER_IP", cls.rate_limit_register_ip),
+            rate_limit_create_task_user=os.getenv(
+                "TASKMANAGER_RATE_LIMIT_CREATE_TASK_USER", cls.rate_limit_create_task_user
+            ),
+            rate_limit_bulk_task_user=os.getenv(
+                "TASKMANAGER_RATE_LIMIT_BULK_TASK_USER", cls.rate_limit_bulk_task_user
+            ),
+            rate_limit_buckets=_env_int("TASKMANAGER_RATE_LIMIT_BUCKETS", cls.rate_limit_buckets),
+            import_chunk_size=_env_int("TASKMANAGER_IMPORT_CHUNK_SIZE", cls.import_chunk_size),
+            sse_heartbeat_seconds=_env_float("TASKMANAGER_SSE_HEARTBEAT_SECONDS", cls.sse_heartbeat_seconds),
+            sse_retry_ms=_env_int("TASKMANAGER_SSE_RETRY_MS", cls.sse_retry_ms),
+            sse_history_size=_env_int("TASKMANAGER_SSE_HISTORY_SIZE", cls.sse_history_size),
+            sse_queue_size=_env_int("TASKMANAGER_SSE_QUEUE_SIZE", cls.sse_queue_size),
+            sse_history_ttl=_env_float("TASKMANAGER_SSE_HISTORY_TTL", cls.sse_history_ttl),
+            compression_enabled=_env_bool("TASKMANAGER_COMPRESSION_ENABLED", cls.compression_enabled),
+            compression_min_size=_env_int("TASKMANAGER_COMPRESSION_MIN_SIZE", cls.compression_min_size),
+            compression_gzip_level=_env_int("TASKMANAGER_COMPRESSION_GZIP_LEVEL", cls.compression_gzip_level),
+            compression_brotli_quality=_env_int("TASKMANAGER_COMPRESSION_BROTLI_QUALITY", cls.compression_brotli_quality),
+            compression_zstd_level=_env_int("TASKMANAGER_COMPRESSION_ZSTD_LEVEL", cls.compression_zstd_level),
+            serve_frontend=_env_bool("TASKMANAGER_SERVE_FRONTEND", cls.serve_frontend),
+            frontend_dir=os.getenv("TASKMANAGER_FRONTEND_DIR", cls.frontend_dir),
+            frontend_build_dir=os.getenv("TASKMANAGER_FRONTEND_BUILD_DIR", cls.frontend_build_dir),
+            metrics_enabled=_env_bool("TASKMANAGER_METRICS_ENABLED", cls.metrics_enabled),
+            query_accounting=_env_bool("TASKMANAGER_QUERY_ACCOUNTING", cls.query_accounting),
+            slow_query_ms=_env_float("TASKMANAGER_SLOW_QUERY_MS", cls.slow_query_ms),
+            n_plus_one_threshold=_env_int("TASKMANAGER_N_PLUS_ONE_THRESHOLD", cls.n_plus_one_threshold),
+            profiling_enabled=_env_bool("TASKMANAGER_PROFILING_ENABLED", cls.profiling_enabled),
+            profile_token=os.getenv("TASKMANAGER_PROFILE_TOKEN", cls.profile_token),
+            profile_sample_rate=_env_float("TASKMANAGER_PROFILE_SAMPLE_RATE", cls.profile_sample_rate),
+            profile_interval_ms=_env_float("TASKMANAGER_PROFILE_INTERVAL_MS", cls.profile_interval_ms),
+            profile_dir=os.getenv("TASKMANAGER_PROFILE_DIR", cls.profile_dir),
+            profile_keep=_env_int("TASKMANAGER_PROFILE_KEEP", cls.profile_keep),
+        )
+
+
+settings = Settings.from_env()
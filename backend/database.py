@@ -1,14 +1,194 @@
-from sqlalchemy import create_engine
+import time
+
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.schema import CreateColumn
+
+from config import Settings, settings
+import metrics
+import query_budget
+
+#  Database connection url - a local SQLite file unless TASKMANAGER_DATABASE_URL says otherwise
+SQLALCHEMY_DATABASE_URL = settings.database_url
+
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return _is_sqlite(url) and make_url(url).database in (None, "", ":memory:")
+
+
+def engine_options(url: str, app_settings: Settings = settings) -> dict:
+    #  Keyword arguments for create_engine / create_async_engine
+    options = {}
+    if _is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False}
+    #  In-memory SQLite uses a single connection per thread, pool sizing does not apply
+    if not _is_memory_sqlite(url):
+        options.update(
+            pool_size=app_settings.db_pool_size,
+            max_overflow=app_settings.db_max_overflow,
+            pool_timeout=app_settings.db_pool_timeout,
+        )
+    #  A file on local disk does not drop connections - only network databases are pinged on checkout
+    if not _is_sqlite(url):
+        options["pool_pre_ping"] = True
+    return options
+
+
+def configure_sqlite(sync_engine, app_settings: Settings = settings) -> None:
+    #  Production connection profile - WAL lets readers run alongside the single writer,
+    #  busy_timeout makes writers wait for the lock instead of failing with "database is locked"
+    if sync_engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={app_settings.sqlite_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={app_settings.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={int(app_settings.sqlite_busy_timeout_ms)}")
+        #  Negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{int(app_settings.sqlite_cache_size_kib)}")
+        cursor.execute(f"PRAGMA mmap_size={int(app_settings.sqlite_mmap_size)}")
+        cursor.execute(f"PRAGMA temp_store={app_settings.sqlite_temp_store}")
+        cursor.close()
+
+
+class _TimedCheckout:
+    #  Records how long each checkout waited for (or spent opening) a connection
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.db_pool_checkout.observe(time.perf_counter() - start)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    #  Pool of the sync engine
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    #  Pool of the async engine - its checkouts wait on an asyncio queue, still inside _do_get
+    pass
+
+
+def instrument_engine(sync_engine) -> None:
+    #  Statement timings for /metrics - a stack per connection, as cursor events do not nest across connections
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        metrics.db_query_duration.observe(
+            time.perf_counter() - started, operation=metrics.statement_operation(statement)
+        )
 
-#  Database connection url - the database is stored locally
-SQLALCHEMY_DATABASE_URL = "sqlite:///./tasks.db"
+    @event.listens_for(sync_engine, "handle_error")
+    def drop_query_timer(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+
+def _configure(sync_engine, app_settings: Settings) -> None:
+    configure_sqlite(sync_engine, app_settings)
+    if app_settings.metrics_enabled:
+        instrument_engine(sync_engine)
+    if app_settings.query_accounting:
+        query_budget.instrument_engine(sync_engine, app_settings)
+
+
+def create_db_engine(app_settings: Settings):
+    #  Engine for app_settings.database_url with its pool, SQLite profile and instrumentation -
+    #  the app builds its own in the lifespan (main.py), scripts use the module-level one below
+    url = app_settings.database_url
+    options = engine_options(url, app_settings)
+    if "pool_size" in options:
+        options["poolclass"] = TimedQueuePool
+    sync_engine = create_engine(url, **options)
+    _configure(sync_engine, app_settings)
+    return sync_engine
+
+
+def create_async_db_engine(app_settings: Settings):
+    #  Async twin of create_db_engine - imported here so the sync path does not need the async driver
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    async_url = async_database_url(app_settings.database_url)
+    options = engine_options(async_url, app_settings)
+    if "pool_size" in options:
+        options["poolclass"] = TimedAsyncAdaptedQueuePool
+    async_engine = create_async_engine(async_url, **options)
+    _configure(async_engine.sync_engine, app_settings)
+    return async_engine
+
+
+def session_factory(bind):
+    return sessionmaker(autocommit=False, autoflush=False, bind=bind)
+
+
+def async_session_factory(async_engine):
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    return async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+#  Engine and sessions of the TASKMANAGER_* environment - for scripts and tools
+#  (init-db, counter / search rebuilds, the benchmark); the app uses its own
+engine = create_db_engine(settings)
 
 #  create new database session
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = session_factory(engine)
 
 Base = declarative_base()
+
+
+def ensure_schema(bind) -> None:
+    #  create_all never alters an existing table, so columns and indexes added to the models
+    #  since a database was created are added here (there is no migration tool)
+    import task_versions
+
+    Base.metadata.create_all(bind=bind)
+    inspector = inspect(bind)
+    with bind.begin() as connection:
+        added = set()
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                    connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}")
+                    added.add((table.name, column.name))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        #  Columns whose default is wrong for the rows that already exist
+        if ("tasks", "change_seq") in added:
+            task_versions.backfill_change_seq(connection)
+
+
+def init_db(bind) -> None:
+    #  Create or upgrade everything the app needs in the database: tables, columns, indexes,
+    #  the search index and the task counter triggers. Safe to run on every start.
+    import task_counters
+    import task_search
+
+    ensure_schema(bind)
+    with bind.begin() as connection:
+        task_search.ensure_index(connection)
+        task_counters.ensure_counters(connection)
+
+
+def async_database_url(url: str) -> str:
+    #  Map a sync SQLite url onto the aiosqlite driver
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
@@ -1,59 +1,177 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import insert, select, tuple_, update
 from sqlalchemy.orm import Session
 from models import Task, User
-from schemas import TaskCreate, UserCreate
+from schemas import StatusEnum, TaskCreate, TaskFilter, UserCreate
+import schemas
 import authentication
+import task_versions
+import task_json
+import task_events
 
 
 # User operations
 def create_user(db: Session, user: UserCreate):
-    #  Create a new user
+    #  Create a new user - one INSERT ... RETURNING, no refresh
     hashed_password = authentication.get_password_hash(user.password)
-    db_user = User(
-        username=user.username,
-        email=user.email,
-        hashed_password=hashed_password
+    stmt = (
+        insert(User)
+        .values(username=user.username, email=user.email, hashed_password=hashed_password)
+        .returning(User.id, User.username, User.email)
     )
-    db.add(db_user)
+    db_user = db.execute(stmt).one()
     db.commit()
-    db.refresh(db_user)
     return db_user
 
 
 # Task operations
-def create_task(db: Session, task: TaskCreate, user_id: int):
-    #  Create a new task for a specific user
-    db_task = Task(**task.model_dump(), user_id=user_id)
-    db.add(db_task)
+#  Writes return the new row with RETURNING instead of reading it back afterwards;
+#  the task counters are kept up to date by triggers (see task_counters)
+def create_task(db: Session, task: TaskCreate, user_id: int) -> schemas.Task:
+    #  Create a new task for a specific user with one INSERT ... RETURNING
+    change_seq = task_versions.bump(db, user_id)
+    stmt = (
+        insert(Task)
+        .values(**task.model_dump(), user_id=user_id, change_seq=change_seq)
+        .returning(*task_json.TASK_COLUMNS)
+    )
+    created = schemas.Task.model_validate(db.execute(stmt).one())
+    db.commit()
+    task_events.publish(user_id, "created", [created.id], created.model_dump(mode="json"))
+    return created
+
+
+def create_tasks_bulk(db: Session, tasks: list[TaskCreate], user_id: int) -> list[int]:
+    #  Insert many tasks for a user in one transaction - a single executemany, no per-row refresh
+    change_seq = task_versions.bump(db, user_id)
+    rows = [{**task.model_dump(), "user_id": user_id, "change_seq": change_seq} for task in tasks]
+    stmt = insert(Task).returning(Task.id, sort_by_parameter_order=True)
+    ids = list(db.scalars(stmt, rows).all())
     db.commit()
-    db.refresh(db_task)
-    return db_task
+    task_events.publish(user_id, "created", ids)
+    return ids
 
 
 def get_task(db: Session, task_id: int, user_id: int):
     # Get a specific task for a user
-    return db.query(Task).filter(Task.id == task_id, Task.user_id == user_id).first()
+    return db.query(Task).filter(
+        Task.id == task_id, Task.user_id == user_id, Task.deleted_at.is_(None)
+    ).first()
 
 
 def get_tasks(db: Session, user_id: int):
     #  Get all tasks for a user
-    return db.query(Task).filter(Task.user_id == user_id).all()
+    return db.query(Task).filter(Task.user_id == user_id, Task.deleted_at.is_(None)).all()
+
+
+def _user_task_clauses(task_id: int, user_id: int) -> list:
+    #  WHERE clauses for a single-task write - the user's own, live task
+    return [Task.id == task_id, Task.user_id == user_id, Task.deleted_at.is_(None)]
+
+
+def update_task_status(db: Session, task_id: int, status: str, user_id: int) -> Optional[schemas.Task]:
+    #  Update task status for a user's task with one UPDATE ... RETURNING, None if there is no such task
+    change_seq = task_versions.bump(db, user_id)
+    stmt = (
+        update(Task)
+        .where(*_user_task_clauses(task_id, user_id))
+        .values(status=StatusEnum(status).value, change_seq=change_seq)
+        .returning(*task_json.TASK_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    row = db.execute(stmt).first()
+    if row is None:
+        #  No such task - leave the version alone
+        db.rollback()
+        return None
+    updated = schemas.Task.model_validate(row)
+    db.commit()
+    task_events.publish(user_id, "updated", [updated.id], updated.model_dump(mode="json"))
+    return updated
 
 
-def update_task_status(db: Session, task_id: int, status: str, user_id: int):
-    #  Update task status for a user's task
-    task = get_task(db, task_id, user_id)
-    if task:
-        task.status = status
-        db.commit()
-        db.refresh(task)
-    return task
+def delete_task(db: Session, task_id: int, user_id: int) -> bool:
+    #  Delete a user's task with one UPDATE ... RETURNING, False if there is no such task.
+    #  The row stays behind as a tombstone for the delta sync.
+    change_seq = task_versions.bump(db, user_id)
+    stmt = (
+        update(Task)
+        .where(*_user_task_clauses(task_id, user_id))
+        .values(deleted_at=datetime.utcnow(), change_seq=change_seq)
+        .returning(Task.id)
+        .execution_options(synchronize_session=False)
+    )
+    if db.execute(stmt).first() is None:
+        db.rollback()
+        return False
+    db.commit()
+    task_events.publish(user_id, "deleted", [task_id])
+    return True
+
 
+def task_filter_clauses(user_id: int, task_filter: TaskFilter) -> list:
+    #  WHERE clauses for a bulk operation - always scoped to the user's live tasks
+    clauses = [Task.user_id == user_id, Task.deleted_at.is_(None)]
+    if task_filter.ids is not None:
+        clauses.append(Task.id.in_(task_filter.ids))
+    if task_filter.status is not None:
+        clauses.append(Task.status == task_filter.status.value)
+    if task_filter.due_before is not None:
+        clauses.append(Task.due_date < task_filter.due_before)
+    if task_filter.due_after is not None:
+        clauses.append(Task.due_date > task_filter.due_after)
+    return clauses
+
+
+def update_tasks_status(db: Session, task_filter: TaskFilter, status: StatusEnum, user_id: int) -> int:
+    #  Set the status of every matching task with one UPDATE ... RETURNING, returns the number of rows changed
+    change_seq = task_versions.bump(db, user_id)
+    stmt = (
+        update(Task)
+        .where(*task_filter_clauses(user_id, task_filter))
+        .values(status=status.value, change_seq=change_seq)
+        .returning(Task.id)
+        .execution_options(synchronize_session=False)
+    )
+    ids = list(db.scalars(stmt).all())
+    if not ids:
+        #  Nothing matched - leave the version (and the clients' ETags) alone
+        db.rollback()
+        return 0
+    db.commit()
+    task_events.publish(user_id, "updated", ids)
+    return len(ids)
+
+
+def delete_tasks(db: Session, task_filter: TaskFilter, user_id: int) -> int:
+    #  Tombstone every matching task with one UPDATE ... RETURNING, returns the number of rows removed
+    change_seq = task_versions.bump(db, user_id)
+    stmt = (
+        update(Task)
+        .where(*task_filter_clauses(user_id, task_filter))
+        .values(deleted_at=datetime.utcnow(), change_seq=change_seq)
+        .returning(Task.id)
+        .execution_options(synchronize_session=False)
+    )
+    ids = list(db.scalars(stmt).all())
+    if not ids:
+        db.rollback()
+        return 0
+    db.commit()
+    task_events.publish(user_id, "deleted", ids)
+    return len(ids)
 
-def delete_task(db: Session, task_id: int, user_id: int):
-    #  Delete a user's task
-    task = get_task(db, task_id, user_id)
-    if task:
-        db.delete(task)
-        db.commit()
-    return task
 
+def get_task_changes(db: Session, user_id: int, since: int, after_id: Optional[int], limit: int) -> list[Task]:
+    #  Tasks (tombstones included) changed after the given sequence, oldest change first.
+    #  One range scan of ix_tasks_user_change_seq; fetches one extra row so the caller can tell if there is more.
+    #  A single write stamps all of its rows with the same sequence, so after_id continues inside one sequence.
+    stmt = select(Task).where(Task.user_id == user_id)
+    if after_id is None:
+        stmt = stmt.where(Task.change_seq > since)
+    else:
+        stmt = stmt.where(tuple_(Task.change_seq, Task.id) > (since, after_id))
+    stmt = stmt.order_by(Task.change_seq, Task.id).limit(limit + 1)
+    return list(db.scalars(stmt).all())
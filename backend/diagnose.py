@@ -45,7 +45,7 @@ packages_to_test = [
     ('sqlalchemy', 'pip install sqlalchemy'),
     ('pydantic', 'pip install pydantic'),
     ('jose', 'pip install python-jose[cryptography]'),
-    ('passlib', 'pip install passlib[bcrypt]'),
+    ('bcrypt', 'pip install bcrypt'),
 ]
 
 failed_packages = []
@@ -94,7 +94,7 @@ if failed_packages:
     for cmd in failed_packages:
         print(f"  {cmd}")
     print("\nOr install all at once:")
-    print(' pip install fastapi uvicorn sqlalchemy pydantic "python-jose[cryptography]" "passlib[bcrypt]" python-multipart email-validator ')
+    print(' pip install fastapi uvicorn sqlalchemy pydantic "python-jose[cryptography]" bcrypt python-multipart email-validator ')
 
 print("\n" + "=" * 60)
 
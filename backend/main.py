@@ -1,132 +1,147 @@
-from datetime import timedelta
-from fastapi import FastAPI, Depends, HTTPException, status
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from fastapi import APIRouter, FastAPI, Body, Depends, Header, HTTPException, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi.security import OAuth2PasswordBearer
 
 # Import local modules
-from database import Base, engine, SessionLocal
+from config import Settings, settings
+from database import (
+    async_session_factory,
+    create_async_db_engine,
+    create_db_engine,
+    engine,
+    init_db,
+    session_factory,
+)
 from models import User, Task
 import schemas
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI()
-
-# CORS Configuration
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:63342",
-        "http://127.0.0.1:63342",
-        "http://localhost:8000",
-        "http://127.0.0.1:8000"
-    ],
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
-    allow_headers=["*"],
-    expose_headers=["*"],
+import pagination
+import db_interaction
+import task_export
+import task_import
+import task_versions
+import task_json
+import task_counters
+import task_events
+import task_search
+import principal_cache
+import rate_limit
+import metrics
+import query_budget
+import compression
+import static_assets
+from principal_cache import Principal
+from password_hashing import PasswordHashingBusy
+from authentication import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    oauth2_scheme,
+    authenticate_user,
+    get_user_by_email,
+    get_user_by_username,
+    get_password_hash,
+    create_access_token,
+    decode_access_token,
 )
 
-# Authentication configuration
-SECRET_KEY = "no need to add a key - only a test app"
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-# Security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+# Auth and task routes - the sync handlers below, or their async twins in async_routes.py
+# (see settings.async_db)
+router = APIRouter()
+
+# Routes shared by the sync and async modes - see create_app() for the order they are included in
+shared_router = APIRouter()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The app's engines are built here from its own settings, and nothing touches the database at
+    # import time - tables, indexes and triggers are checked here, or once per deployment with
+    # "python main.py init-db" and TASKMANAGER_INIT_DB_ON_STARTUP=false
+    app_settings = app.state.settings
+    app.state.engine = create_db_engine(app_settings)
+    app.state.session_factory = session_factory(app.state.engine)
+    app.state.async_engine = None
+    if app_settings.async_db:
+        app.state.async_engine = create_async_db_engine(app_settings)
+        app.state.async_session_factory = async_session_factory(app.state.async_engine)
+    if app_settings.init_db_on_startup:
+        init_db(app.state.engine)
+    if app_settings.serve_frontend:
+        static_assets.ensure_built(app_settings.frontend_dir, app_settings.frontend_build_dir)
+    yield
+    # End open event streams so the server can shut down
+    task_events.hub.close()
+    if app.state.async_engine is not None:
+        # aiosqlite keeps a thread per connection that would otherwise stop the process from exiting
+        await app.state.async_engine.dispose()
+    app.state.engine.dispose()
+
+
+# Login / register storms - shed load quickly instead of queueing behind the hashing pool
+def password_hashing_busy_handler(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
 
 
 # Database dependency
-def get_db():
-    # Database session
-    db = SessionLocal()
+def get_db(request: Request):
+    # Database session - the session factory is built in the app's lifespan
+    db = request.app.state.session_factory()
     try:
         yield db
     finally:
         db.close()
 
 
-# Password utilities
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    # Bcrypt has a 72 byte limit
-    import bcrypt
-    password_bytes = plain_password.encode('utf-8')[:72]
-    hashed_bytes = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(password_bytes, hashed_bytes)
-
-
-def get_password_hash(password: str) -> str:
-    # Bcrypt has a 72 byte limit
-    import bcrypt
-    password_bytes = password.encode('utf-8')[:72]
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password_bytes, salt)
-    return hashed.decode('utf-8')
-
-
-# Token utilities
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
-    to_encode = data.copy()
-    if expires_delta:
-        from datetime import datetime
-        expire = datetime.utcnow() + expires_delta
-    else:
-        from datetime import datetime
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
-
-
-# User utilities
-def get_user_by_username(db: Session, username: str) -> Optional[User]:
-    return db.query(User).filter(User.username == username).first()
-
-
-def get_user_by_email(db: Session, email: str) -> Optional[User]:
-    return db.query(User).filter(User.email == email).first()
-
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    # Served from the principal cache when possible - no token decode, no users query
+    principal = principal_cache.cache.get(token)
+    if principal is not None:
+        return principal
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
-    user = get_user_by_username(db, username)
-    if not user:
-        return None
-    if not verify_password(password, user.hashed_password):
-        return None
-    return user
-
-
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
+    payload = decode_access_token(token)
+    if payload is None:
         raise credentials_exception
 
-    user = get_user_by_username(db, username=username)
+    user = get_user_by_username(db, username=payload["sub"])
     if user is None:
         raise credentials_exception
-    return user
+    return principal_cache.cache.put(token, user, payload["exp"])
+
+
+def limit_task_creation(request: Request, current_user: Principal = Depends(get_current_user)) -> None:
+    # Per user - get_current_user is resolved once per request, so this costs no extra lookup
+    request.app.state.rate_limiters["create_task_user"].check(current_user.id)
+
+
+def limit_bulk_task_creation(request: Request, current_user: Principal = Depends(get_current_user)) -> None:
+    # /tasks/bulk and /tasks/import - a limit of their own, one of them may write thousands of rows
+    request.app.state.rate_limiters["bulk_task_user"].check(current_user.id)
+
+
+def _cache_headers(etag: str) -> dict:
+    # Clients may keep task reads but must revalidate them (If-None-Match) before reuse
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
 
 
 # ============================================================================
 # ROUTES
 # ============================================================================
 
-@app.post("/register", response_model=schemas.User, status_code=status.HTTP_201_CREATED)
+@router.post("/register", response_model=schemas.User, status_code=status.HTTP_201_CREATED,
+             dependencies=[Depends(rate_limit.limit_register)])
 def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     """Register a new user"""
     # Check if username exists
@@ -139,20 +154,19 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    # Create new user
+    # Create new user - one INSERT ... RETURNING instead of INSERT, commit and a refresh SELECT
     hashed_password = get_password_hash(user.password)
-    db_user = User(
-        username=user.username,
-        email=user.email,
-        hashed_password=hashed_password
+    stmt = (
+        insert(User)
+        .values(username=user.username, email=user.email, hashed_password=hashed_password)
+        .returning(User.id, User.username, User.email)
     )
-    db.add(db_user)
+    db_user = db.execute(stmt).one()
     db.commit()
-    db.refresh(db_user)
     return db_user
 
 
-@app.post("/login", response_model=schemas.Token)
+@router.post("/login", response_model=schemas.Token, dependencies=[Depends(rate_limit.limit_login)])
 def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     """Login and get access token"""
     user = authenticate_user(db, form_data.username, form_data.password)
@@ -170,93 +184,361 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     return {"access_token": access_token, "token_type": "bearer"}
 
 
-@app.get("/users/me", response_model=schemas.User)
-def read_users_me(current_user: User = Depends(get_current_user)):
+@router.get("/users/me", response_model=schemas.User)
+def read_users_me(current_user: Principal = Depends(get_current_user)):
     """Get current user information"""
     return current_user
 
 
 # Task endpoints
-@app.post("/tasks", response_model=schemas.Task, status_code=status.HTTP_201_CREATED)
+@router.post("/tasks", response_model=schemas.Task, status_code=status.HTTP_201_CREATED,
+             dependencies=[Depends(limit_task_creation)])
 def create_task(
         task: schemas.TaskCreate,
-        current_user: User = Depends(get_current_user),
+        current_user: Principal = Depends(get_current_user),
         db: Session = Depends(get_db)
 ):
     """Create a new task"""
-    db_task = Task(**task.model_dump(), user_id=current_user.id)
-    db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
-    return db_task
+    return db_interaction.create_task(db, task, current_user.id)
 
 
-@app.get("/tasks", response_model=list[schemas.Task])
+@router.post("/tasks/bulk", response_model=schemas.TaskBulkCreated, status_code=status.HTTP_201_CREATED,
+             dependencies=[Depends(limit_bulk_task_creation)])
+def create_tasks_bulk(
+        tasks: list[schemas.TaskCreate] = Body(..., min_length=1, max_length=schemas.MAX_BULK_TASKS),
+        current_user: Principal = Depends(get_current_user),
+        db: Session = Depends(get_db)
+):
+    """Create many tasks in one transaction and return their ids in request order"""
+    ids = db_interaction.create_tasks_bulk(db, tasks, current_user.id)
+    return {"ids": ids}
+
+
+@router.get("/tasks", response_model=list[schemas.Task])
 def read_tasks(
-        current_user: User = Depends(get_current_user),
+        request: Request,
+        limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        status_filter: Optional[schemas.StatusEnum] = Query(None, alias="status"),
+        due_before: Optional[datetime] = None,
+        due_after: Optional[datetime] = None,
+        sort: schemas.TaskSort = schemas.TaskSort.id,
+        current_user: Principal = Depends(get_current_user),
         db: Session = Depends(get_db)
 ):
-    """Get all tasks for current user"""
-    return db.query(Task).filter(Task.user_id == current_user.id).all()
+    """Get one page of tasks for current user - the next page cursor is sent in the X-Next-Cursor header"""
+    etag = task_versions.list_etag(current_user.id, task_versions.current(db, current_user.id), request.url.query)
+    if task_versions.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_cache_headers(etag))
+    headers = _cache_headers(etag)
+
+    after = None
+    if cursor:
+        try:
+            after = pagination.decode_cursor(cursor, sort)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    stmt = pagination.task_page_statement(
+        current_user.id, limit, sort=sort, after=after,
+        status=status_filter, due_before=due_before, due_after=due_after,
+    )
+    rows = db.execute(task_json.task_columns(stmt)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = pagination.encode_cursor(sort, rows[-1])
+    return task_json.task_list_response(rows, headers)
 
 
-@app.get("/tasks/{task_id}", response_model=schemas.Task)
+@router.get("/tasks/{task_id}", response_model=schemas.Task)
 def read_task(
         task_id: int,
-        current_user: User = Depends(get_current_user),
+        request: Request,
+        response: Response,
+        current_user: Principal = Depends(get_current_user),
         db: Session = Depends(get_db)
 ):
     """Get a specific task"""
+    etag = task_versions.task_etag(current_user.id, task_versions.current(db, current_user.id), task_id)
+    if_none_match = request.headers.get("if-none-match")
+    if task_versions.etag_matches(if_none_match, etag, exists=False):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_cache_headers(etag))
+
     task = db.query(Task).filter(
         Task.id == task_id,
-        Task.user_id == current_user.id
+        Task.user_id == current_user.id,
+        Task.deleted_at.is_(None)
     ).first()
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
+    if task_versions.etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_cache_headers(etag))
+    response.headers.update(_cache_headers(etag))
     return task
 
 
-@app.patch("/tasks/{task_id}/status", response_model=schemas.Task)
+@router.patch("/tasks/status", response_model=schemas.TaskBulkResult)
+def update_status_bulk(
+        bulk_update: schemas.TaskBulkStatusUpdate,
+        current_user: Principal = Depends(get_current_user),
+        db: Session = Depends(get_db)
+):
+    """Update the status of every task matching the filter"""
+    affected = db_interaction.update_tasks_status(db, bulk_update.filter, bulk_update.status, current_user.id)
+    return {"affected": affected}
+
+
+@router.delete("/tasks", response_model=schemas.TaskBulkResult)
+def delete_tasks_bulk(
+        task_filter: schemas.TaskFilter,
+        current_user: Principal = Depends(get_current_user),
+        db: Session = Depends(get_db)
+):
+    """Delete every task matching the filter"""
+    affected = db_interaction.delete_tasks(db, task_filter, current_user.id)
+    return {"affected": affected}
+
+
+@router.patch("/tasks/{task_id}/status", response_model=schemas.Task)
 def update_status(
         task_id: int,
         status_update: schemas.TaskUpdateStatus,
-        current_user: User = Depends(get_current_user),
+        current_user: Principal = Depends(get_current_user),
         db: Session = Depends(get_db)
 ):
     """Update task status"""
-    task = db.query(Task).filter(
-        Task.id == task_id,
-        Task.user_id == current_user.id
-    ).first()
+    task = db_interaction.update_task_status(db, task_id, status_update.status, current_user.id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-
-    task.status = status_update.status
-    db.commit()
-    db.refresh(task)
     return task
 
 
-@app.delete("/tasks/{task_id}")
+@router.delete("/tasks/{task_id}")
 def delete_task(
         task_id: int,
-        current_user: User = Depends(get_current_user),
+        current_user: Principal = Depends(get_current_user),
         db: Session = Depends(get_db)
 ):
     """Delete a task"""
-    task = db.query(Task).filter(
-        Task.id == task_id,
-        Task.user_id == current_user.id
-    ).first()
+    task = db_interaction.delete_task(db, task_id, current_user.id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-
-    db.delete(task)
-    db.commit()
     return {"detail": "Task deleted"}
 
 
+# ============================================================================
+# ROUTES SHARED BY THE SYNC AND ASYNC MODES
+# Included before the auth and task router, so fixed paths such as
+# /tasks/export take precedence over /tasks/{task_id}.
+# ============================================================================
+
+EXPORT_MEDIA_TYPES = {
+    schemas.TaskFileFormat.ndjson: "application/x-ndjson",
+    schemas.TaskFileFormat.csv: "text/csv",
+}
+
+
+@shared_router.get("/tasks/export", response_class=StreamingResponse)
+def export_tasks(
+        export_format: schemas.TaskFileFormat = Query(schemas.TaskFileFormat.ndjson, alias="format"),
+        current_user: Principal = Depends(get_current_user),
+        db: Session = Depends(get_db)
+):
+    """Stream every task of the current user as NDJSON or CSV"""
+    if export_format == schemas.TaskFileFormat.csv:
+        rows = task_export.iter_csv(db, current_user.id)
+    else:
+        rows = task_export.iter_ndjson(db, current_user.id)
+    return StreamingResponse(
+        rows,
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="tasks.{export_format.value}"'},
+    )
+
+
+@shared_router.get("/tasks/changes", response_model=schemas.TaskChanges)
+def read_task_changes(
+        since: int = Query(0, ge=0),
+        after_id: Optional[int] = Query(None, ge=0),
+        limit: int = Query(pagination.MAX_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+        current_user: Principal = Depends(get_current_user),
+        db: Session = Depends(get_db)
+):
+    """Get the tasks created, updated or deleted after a change sequence - deleted tasks come back as tombstones"""
+    tasks = db_interaction.get_task_changes(db, current_user.id, since, after_id, limit)
+    has_more = len(tasks) > limit
+    tasks = tasks[:limit]
+    if tasks:
+        since, after_id = tasks[-1].change_seq, tasks[-1].id
+    return {
+        "changes": tasks,
+        "since": since,
+        # Only needed to continue inside a sequence - once caught up, since alone is the checkpoint
+        "after_id": after_id if has_more else None,
+        "has_more": has_more,
+    }
+
+
+@shared_router.get("/tasks/stats", response_model=schemas.TaskStats)
+def read_task_stats(
+        today: Optional[date] = Query(None, description="The client's current date, defaults to the server's"),
+        current_user: Principal = Depends(get_current_user),
+        db: Session = Depends(get_db)
+):
+    """Task counts by status, plus the open tasks that are overdue or due today - read from the task counters"""
+    return task_counters.stats(db, current_user.id, today or date.today())
+
+
+@shared_router.get("/tasks/search", response_model=list[schemas.Task])
+def search_tasks(
+        q: str = Query(..., min_length=1, max_length=200),
+        limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+        offset: int = Query(0, ge=0),
+        current_user: Principal = Depends(get_current_user),
+        db: Session = Depends(get_db)
+):
+    """Search the current user's tasks by title and description, best match first - the next page offset is sent in the X-Next-Offset header"""
+    stmt = task_search.search_statement(db.get_bind().dialect.name, current_user.id, q, limit, offset)
+    if stmt is None:
+        return task_json.task_list_response([])
+    headers = {}
+    rows = db.execute(task_json.task_columns(stmt)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Offset"] = str(offset + limit)
+    return task_json.task_list_response(rows, headers)
+
+
+# EventSource cannot send an Authorization header, so the event stream also accepts ?access_token=
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
+
+
+@shared_router.get("/tasks/events", response_class=StreamingResponse)
+def task_event_stream(
+        request: Request,
+        access_token: Optional[str] = Query(None),
+        header_token: Optional[str] = Depends(optional_oauth2_scheme),
+        last_event_id: Optional[str] = Header(None),
+        db: Session = Depends(get_db)
+):
+    """Server-Sent Events stream of created / updated / deleted events for the current user's tasks"""
+    token = header_token or access_token
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    current_user = get_current_user(token, db)
+    # Give the connection back to the pool - the stream can stay open for hours
+    db.close()
+    app_settings = request.app.state.settings
+    return StreamingResponse(
+        task_events.stream(
+            task_events.hub, current_user.id, last_event_id,
+            app_settings.sse_heartbeat_seconds, app_settings.sse_retry_ms,
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@shared_router.post("/tasks/import", response_model=schemas.TaskImportResult,
+                    dependencies=[Depends(limit_bulk_task_creation)])
+async def import_tasks(
+        request: Request,
+        import_format: schemas.TaskFileFormat = Query(schemas.TaskFileFormat.ndjson, alias="format"),
+        current_user: Principal = Depends(get_current_user),
+        db: Session = Depends(get_db)
+):
+    """Import tasks from an NDJSON or CSV request body - invalid rows are reported, not fatal"""
+    return await task_import.import_tasks(
+        request.stream(), import_format, db, current_user.id, request.app.state.settings.import_chunk_size
+    )
+
+
+def read_metrics():
+    """Prometheus metrics in the text exposition format"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+def read_root():
+    """The frontend's home page"""
+    return RedirectResponse("/app/home.html")
+
+
+# ============================================================================
+# APPLICATION
+# ============================================================================
+
+def create_app(app_settings: Optional[Settings] = None) -> FastAPI:
+    # Build the application for the given settings (default: the TASKMANAGER_* environment).
+    # They decide the database and its engines, the middlewares, rate limits, routes and the
+    # frontend. Process-wide singletons stay configured from the environment: the password
+    # hashing policy and worker pool, the principal cache, the event hub and the metrics registry.
+    app_settings = app_settings or settings
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = app_settings
+    app.state.rate_limiters = rate_limit.build_limiters(app_settings)
+
+    # CORS Configuration
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[
+            "http://localhost:63342",
+            "http://127.0.0.1:63342",
+            "http://localhost:8000",
+            "http://127.0.0.1:8000"
+        ],
+        allow_credentials=True,
+        allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
+        allow_headers=["*"],
+        expose_headers=["*"],
+    )
+    if app_settings.compression_enabled:
+        app.add_middleware(compression.CompressionMiddleware, app_settings=app_settings)
+    if app_settings.metrics_enabled:
+        app.add_middleware(metrics.MetricsMiddleware)
+    if app_settings.query_accounting:
+        app.add_middleware(query_budget.QueryBudgetMiddleware, app_settings=app_settings)
+    if app_settings.profiling_enabled:
+        import profiling
+
+        app.add_middleware(profiling.ProfilingMiddleware, app_settings=app_settings)
+
+    app.add_exception_handler(PasswordHashingBusy, password_hashing_busy_handler)
+
+    if app_settings.metrics_enabled:
+        app.add_api_route("/metrics", read_metrics, response_class=PlainTextResponse, include_in_schema=False)
+    if app_settings.serve_frontend:
+        app.add_api_route("/", read_root, include_in_schema=False)
+        app.mount("/app", static_assets.StaticAssets(app_settings.frontend_build_dir), name="frontend")
+    app.include_router(shared_router)
+    if app_settings.async_db:
+        # Only async mode needs the async routes (and with them the async SQLAlchemy extension)
+        import async_routes
+
+        app.include_router(async_routes.router)
+    else:
+        app.include_router(router)
+    return app
+
+
+app = create_app()
+
+
 if __name__ == "__main__":
-    import uvicorn
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Task Manager API")
+    parser.add_argument("command", nargs="?", choices=["serve", "init-db"], default="serve",
+                        help="serve the API (default), or create / upgrade the database schema and exit")
+    args = parser.parse_args()
+
+    if args.command == "init-db":
+        init_db(engine)
+        print("database initialized")
+    else:
+        import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,207 @@
+"""
+Prometheus metrics, served at GET /metrics
+
+A small in-process registry of counters, gauges and histograms rendered in the
+Prometheus text exposition format - no client library needed. Collected:
+
+    http_requests_total / http_request_duration_seconds
+        per method and route template (/tasks/{task_id}, not the raw path)
+    http_requests_in_progress       per method
+    db_query_duration_seconds       per statement type, from SQLAlchemy cursor events
+    db_pool_checkout_seconds        time spent getting a connection from the pool
+    password_hashing_duration_seconds  hash / verify jobs, queueing on the pool included
+"""
+import threading
+import time
+from typing import Iterable
+
+# Latency buckets in seconds - from fast cached reads up to multi-second bcrypt queues
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines += self._samples()
+        return lines
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> [count per bucket (not cumulative)..., sum]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[:-1]) if entry else 0
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, entry in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(entry[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by method, route template and status code",
+    ("method", "route", "status"),
+))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Time until the last byte of the response was sent",
+    ("method", "route"),
+))
+http_requests_in_progress = registry.register(Gauge(
+    "http_requests_in_progress", "Requests being handled right now",
+    ("method",),
+))
+db_query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "Database statement execution time by statement type",
+    ("operation",),
+))
+db_pool_checkout = registry.register(Histogram(
+    "db_pool_checkout_seconds", "Time spent waiting for (or opening) a pooled database connection",
+))
+password_hashing_duration = registry.register(Histogram(
+    "password_hashing_duration_seconds", "Password hashing pool jobs, queueing included",
+    ("operation",),
+))
+
+
+def statement_operation(statement: str) -> str:
+    # SELECT / INSERT / UPDATE / DELETE ... - the first keyword, so the label set stays small
+    words = statement.lstrip().split(None, 1)
+    operation = words[0].upper() if words else ""
+    if operation in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "PRAGMA", "CREATE", "ALTER", "DROP"):
+        return operation
+    return "OTHER"
+
+
+def route_template(scope) -> str:
+    # Path template of the route that handled the request - the router records it in the scope
+    route = scope.get("route")
+    if route is None and scope.get("endpoint") is not None:
+        # A mounted app (the frontend) - only its mount point is recorded
+        return scope.get("root_path", "") + "/{path}"
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    # Pure ASGI middleware - streaming responses pass through untouched
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc(method=method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_progress.dec(method=method)
+            route = route_template(scope)
+            http_request_duration.observe(time.perf_counter() - start, method=method, route=route)
+            http_requests.inc(method=method, route=route, status=status_code)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Date, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -28,4 +28,45 @@ class Task(Base):
     # References the 'id' column in the 'users' table
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     owner = relationship("User", back_populates="tasks")  # Relationship to user
+    # Change sequence - the owner's task_versions.version of the write that last touched the row
+    change_seq = Column(Integer, nullable=False, default=0, server_default="0")
+    # Tombstone - deleted tasks keep their row so GET /tasks/changes can report the delete
+    deleted_at = Column(DateTime, nullable=True)
 
+    # Composite index for the task list - covers the user scope, the status filter
+    # and the (due_date, id) keyset used by cursor pagination.
+    # Without a status filter the list is read in (user_id, id) or (user_id, due_date, id)
+    # order, so each page is an index range scan rather than a sort of all the user's rows.
+    # (user_id, change_seq) serves the delta sync - a range scan over the changes since a sequence
+    __table_args__ = (
+        Index("ix_tasks_user_status_due_id", "user_id", "status", "due_date", "id"),
+        Index("ix_tasks_user_id", "user_id", "id"),
+        Index("ix_tasks_user_due_id", "user_id", "due_date", "id"),
+        Index("ix_tasks_user_change_seq", "user_id", "change_seq"),
+    )
+
+    @property
+    def deleted(self) -> bool:
+        return self.deleted_at is not None
+
+
+class TaskVersion(Base):
+    # Table name in database {task_versions}
+    # One row per user, bumped in the same transaction as every write to that user's tasks.
+    # Used as the ETag of the task list / task reads.
+    __tablename__ = "task_versions"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class TaskCounter(Base):
+    # Table name in database {task_counters}
+    # Number of live tasks per user, status and due day - kept up to date in the same transaction
+    # as every write to the user's tasks, so GET /tasks/stats never reads the tasks table
+    __tablename__ = "task_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    status = Column(String, primary_key=True)
+    due_day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,72 @@
+"""
+Keyset (cursor) pagination for task lists
+
+A cursor is an opaque, url-safe token holding the sort key of the last row
+of the previous page. The next page starts strictly after that key, so each
+page is a single index range scan no matter how deep the client pages.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, tuple_
+
+from models import Task
+from schemas import StatusEnum, TaskSort
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(sort: TaskSort, task: Task) -> str:
+    # Build the cursor pointing just after the given task (ORM object or task_json row)
+    key = {"s": sort.value, "i": task.id}
+    if sort == TaskSort.due_date:
+        key["d"] = task.due_date.isoformat()
+    raw = json.dumps(key, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: TaskSort) -> dict:
+    # Raises ValueError if the cursor is malformed or was issued for another sort order
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if key["s"] != sort.value:
+            raise ValueError("cursor was issued for a different sort order")
+        decoded = {"id": int(key["i"])}
+        if sort == TaskSort.due_date:
+            decoded["due_date"] = datetime.fromisoformat(key["d"])
+        return decoded
+    except (KeyError, TypeError, UnicodeError, json.JSONDecodeError) as exc:
+        raise ValueError("malformed cursor") from exc
+
+
+def task_page_statement(
+        user_id: int,
+        limit: int,
+        sort: TaskSort = TaskSort.id,
+        after: Optional[dict] = None,
+        status: Optional[StatusEnum] = None,
+        due_before: Optional[datetime] = None,
+        due_after: Optional[datetime] = None,
+):
+    # One page of a user's tasks; fetches one extra row so the caller can tell if there is a next page
+    stmt = select(Task).where(Task.user_id == user_id, Task.deleted_at.is_(None))
+    if status is not None:
+        stmt = stmt.where(Task.status == status.value)
+    if due_before is not None:
+        stmt = stmt.where(Task.due_date < due_before)
+    if due_after is not None:
+        stmt = stmt.where(Task.due_date > due_after)
+
+    if sort == TaskSort.due_date:
+        if after is not None:
+            stmt = stmt.where(tuple_(Task.due_date, Task.id) > (after["due_date"], after["id"]))
+        stmt = stmt.order_by(Task.due_date, Task.id)
+    else:
+        if after is not None:
+            stmt = stmt.where(Task.id > after["id"])
+        stmt = stmt.order_by(Task.id)
+    return stmt.limit(limit + 1)
@@ -0,0 +1,90 @@
+"""
+Code that runs inside the password hashing pool processes
+
+The pool processes are spawned, and a spawned process first imports the
+parent's __main__ module. For `python main.py` or a debug script that would be
+the whole app - or, for a script without a __main__ guard, a crash that turns
+/register and /login into 503s. password_hashing.py therefore starts its
+workers with this module standing in for __main__, so it must stay small:
+the standard library at import time, bcrypt and argon2 only when a job needs them.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+# bcrypt only looks at the first 72 bytes of a password
+BCRYPT_MAX_BYTES = 72
+
+
+@dataclass(frozen=True)
+class HashingPolicy:
+    # How new hashes are made - sent along with every job to the pool processes
+    scheme: str = "bcrypt"
+    bcrypt_rounds: int = 12
+    argon2_time_cost: int = 3
+    argon2_memory_cost: int = 65536  # KiB
+    argon2_parallelism: int = 4
+
+    def __post_init__(self):
+        if self.scheme not in ("bcrypt", "argon2"):
+            raise ValueError(f"unknown password hash scheme {self.scheme!r}")
+
+    @classmethod
+    def from_settings(cls, settings) -> "HashingPolicy":
+        return cls(
+            scheme=settings.password_hash_scheme,
+            bcrypt_rounds=settings.bcrypt_rounds,
+            argon2_time_cost=settings.argon2_time_cost,
+            argon2_memory_cost=settings.argon2_memory_cost,
+            argon2_parallelism=settings.argon2_parallelism,
+        )
+
+
+def _argon2_hasher(policy: HashingPolicy):
+    from argon2 import PasswordHasher
+    return PasswordHasher(
+        time_cost=policy.argon2_time_cost,
+        memory_cost=policy.argon2_memory_cost,
+        parallelism=policy.argon2_parallelism,
+    )
+
+
+def _hash(password: str, policy: HashingPolicy) -> str:
+    if policy.scheme == "argon2":
+        return _argon2_hasher(policy).hash(password)
+    import bcrypt
+    password_bytes = password.encode('utf-8')[:BCRYPT_MAX_BYTES]
+    return bcrypt.hashpw(password_bytes, bcrypt.gensalt(policy.bcrypt_rounds)).decode('utf-8')
+
+
+def _verify(password: str, hashed_password: str, policy: HashingPolicy) -> bool:
+    # Any supported scheme verifies, whatever the current policy says
+    if hashed_password.startswith("$argon2"):
+        from argon2.exceptions import VerificationError, InvalidHashError
+        try:
+            return _argon2_hasher(policy).verify(hashed_password, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    import bcrypt
+    password_bytes = password.encode('utf-8')[:BCRYPT_MAX_BYTES]
+    return bcrypt.checkpw(password_bytes, hashed_password.encode('utf-8'))
+
+
+def needs_update(hashed_password: str, policy: HashingPolicy) -> bool:
+    # True if the hash was made with another scheme or other costs than the policy asks for
+    if policy.scheme == "argon2":
+        if not hashed_password.startswith("$argon2"):
+            return True
+        return _argon2_hasher(policy).check_needs_rehash(hashed_password)
+    if not hashed_password.startswith("$2"):
+        return True
+    # $2b$<rounds>$<salt and hash>
+    return int(hashed_password.split("$")[2]) != policy.bcrypt_rounds
+
+
+def _verify_and_update(password: str, hashed_password: str, policy: HashingPolicy) -> tuple[bool, Optional[str]]:
+    # (valid, new hash) - the new hash is only made for a valid password whose hash is below the policy
+    if not _verify(password, hashed_password, policy):
+        return False, None
+    if needs_update(hashed_password, policy):
+        return True, _hash(password, policy)
+    return True, None
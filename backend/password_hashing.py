@@ -0,0 +1,178 @@
+"""
+Password hashing on a dedicated process pool
+
+bcrypt is deliberately slow and CPU bound. Running it inline lets a burst of
+/login or /register calls fill the request threadpool and stall every other
+endpoint, so hashing and verification run on their own process pool instead.
+
+The pool has a fixed number of workers and a bounded number of waiting jobs.
+Once both are full, new calls fail straight away with PasswordHashingBusy
+(turned into a 503 by main.py) instead of queueing without limit. Jobs that
+do not finish within the timeout fail the same way, and so does a job whose
+worker process died (killed for memory, crashed) - the broken pool is
+replaced and the next call starts fresh workers.
+
+The hashing policy - bcrypt with a number of rounds, or argon2 with time,
+memory and parallelism costs - comes from the settings. Hashes made under an
+older policy still verify, and verify_and_update also returns a new hash for
+them so the login can store it (rehash on login).
+argon2 needs the optional argon2-cffi package.
+"""
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.context import SpawnContext, SpawnProcess
+from typing import Optional
+
+from config import settings
+import metrics
+import password_hash_worker
+from password_hash_worker import HashingPolicy, _hash, _verify, _verify_and_update, needs_update
+
+
+class PasswordHashingBusy(Exception):
+    """The hashing pool is saturated or the job timed out"""
+
+
+def _observe(fn, start: float) -> None:
+    # hash / verify / verify_and_update job timings for /metrics
+    metrics.password_hashing_duration.observe(time.perf_counter() - start, operation=fn.__name__.lstrip("_"))
+
+
+# Held while a worker starts, so only one process start at a time swaps __main__
+_main_swap_lock = threading.Lock()
+
+
+class _WorkerProcess(SpawnProcess):
+    # A spawned process imports the parent's __main__ before it runs any job.
+    # Starting it with password_hash_worker in that place keeps the workers
+    # from importing the app (or re-running a debug script) on startup.
+    def start(self):
+        with _main_swap_lock:
+            main_module = sys.modules["__main__"]
+            sys.modules["__main__"] = password_hash_worker
+            try:
+                super().start()
+            finally:
+                sys.modules["__main__"] = main_module
+
+
+class _WorkerContext(SpawnContext):
+    Process = _WorkerProcess
+
+
+class PasswordHashingPool:
+    def __init__(self, workers: int, queue_size: int, timeout: float):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        # One slot per running or waiting job
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Started on first use so importing the app does not spawn processes.
+        # "spawn" because the server process is multi-threaded by the time we get here.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=_WorkerContext(),
+                )
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        # A worker died, which breaks the executor for good - drop it so the next call starts a new one
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, fn, *args):
+        # Returns the executor along with the future, so a broken one can be discarded
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashingBusy("password hashing pool is full")
+        executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._discard(executor)
+            raise PasswordHashingBusy("password hashing pool was restarted")
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the job really finishes, even if the caller gave up on it
+        future.add_done_callback(lambda _: self._slots.release())
+        return executor, future
+
+    def run(self, fn, *args):
+        # Blocking call for the sync handlers
+        start = time.perf_counter()
+        executor, future = self._submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise PasswordHashingBusy("password hashing timed out")
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise PasswordHashingBusy("password hashing worker died")
+        finally:
+            _observe(fn, start)
+
+    async def run_async(self, fn, *args):
+        # Awaitable call for the async handlers - does not hold a thread while waiting
+        start = time.perf_counter()
+        executor, future = self._submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise PasswordHashingBusy("password hashing timed out")
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise PasswordHashingBusy("password hashing worker died")
+        finally:
+            _observe(fn, start)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+policy = HashingPolicy.from_settings(settings)
+
+pool = PasswordHashingPool(
+    workers=settings.password_hash_workers,
+    queue_size=settings.password_hash_queue_size,
+    timeout=settings.password_hash_timeout,
+)
+
+
+def hash_password(password: str) -> str:
+    return pool.run(_hash, password, policy)
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    return pool.run(_verify, password, hashed_password, policy)
+
+
+def verify_and_update(password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    return pool.run(_verify_and_update, password, hashed_password, policy)
+
+
+async def hash_password_async(password: str) -> str:
+    return await pool.run_async(_hash, password, policy)
+
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    return await pool.run_async(_verify, password, hashed_password, policy)
+
+
+async def verify_and_update_async(password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    return await pool.run_async(_verify_and_update, password, hashed_password, policy)
@@ -0,0 +1,101 @@
+"""
+In-process cache of authenticated principals
+
+get_current_user would otherwise decode the JWT and load the user row on every
+authenticated request. Entries are keyed by the raw token, hold a small
+immutable copy of the user, and live until the cache TTL or the token expiry,
+whichever comes first. Least recently used entries are evicted once the cache
+is full.
+
+Any change to a User row made through the ORM drops that user's entries (see
+the mapper events at the bottom). Code that changes users with bulk UPDATE or
+DELETE statements must call cache.invalidate_user itself.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+
+from config import settings
+from models import User
+
+
+@dataclass(frozen=True)
+class Principal:
+    # The parts of a user the request handlers need - safe to share between requests
+    id: int
+    username: str
+    email: str
+
+
+class PrincipalCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[float, Principal]]" = OrderedDict()
+        self._tokens_by_user: dict[int, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires_at, principal = entry
+            if expires_at <= time.time():
+                self._remove(token)
+                return None
+            self._entries.move_to_end(token)
+            return principal
+
+    def put(self, token: str, user: User, token_expires_at: float) -> Principal:
+        # Returns the principal for the user whether or not it was cached
+        principal = Principal(id=user.id, username=user.username, email=user.email)
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return principal
+        expires_at = min(time.time() + self.ttl, token_expires_at)
+        with self._lock:
+            self._remove(token)
+            self._entries[token] = (expires_at, principal)
+            self._tokens_by_user.setdefault(principal.id, set()).add(token)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+        return principal
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._remove(token)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, token: str) -> None:
+        # Caller holds the lock
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[1].id
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+
+cache = PrincipalCache(maxsize=settings.principal_cache_size, ttl=settings.principal_cache_ttl)
+
+
+# Drop cached principals whenever a user row is changed or deleted through the ORM
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+    cache.invalidate_user(target.id)
@@ -0,0 +1,130 @@
+"""
+On-demand request profiling
+
+Off unless settings.profiling_enabled. A request is profiled when it carries
+X-Profile: <settings.profile_token> (there are no admin accounts, so holding the
+token is what makes a caller an admin), or at random with probability
+settings.profile_sample_rate.
+
+A profiled request is sampled by a background thread that records the Python
+stacks of every thread each settings.profile_interval_ms - a sync route runs in
+the threadpool, not on the event loop, so profiling only the current thread
+would miss it. Idle threads (waiting on a lock, queue or selector) are left
+out. Other requests handled at the same time show up in the profile too.
+
+Profiles are written to settings.profile_dir in the collapsed-stack format
+read by flamegraph.pl, speedscope and inferno, one file per request:
+
+    <unix ms>_<METHOD>_<route>_<duration>ms.collapsed
+
+Only the newest settings.profile_keep files are kept.
+"""
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from config import Settings, settings
+from metrics import route_template
+
+PROFILE_HEADER = b"x-profile"
+SUFFIX = ".collapsed"
+
+# Innermost frames of a thread that is waiting rather than working
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+    return f"{module}:{code.co_name}"
+
+
+class StackSampler(threading.Thread):
+    # Samples the stacks of all other threads until stop() - counts per collapsed stack
+    def __init__(self, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.ident or os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        self._stopped.set()
+        self.join()
+        return self.samples
+
+
+def collapsed(samples: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(samples.items()))
+
+
+def profile_name(method: str, route: str, duration: float) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+    return f"{int(time.time() * 1000)}_{method}_{slug}_{duration * 1000:.0f}ms{SUFFIX}"
+
+
+def write_profile(directory: str, name: str, samples: Counter, keep: int) -> Path:
+    # Write one profile and delete the oldest ones beyond keep
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+    target = path / name
+    target.write_text(collapsed(samples))
+    profiles = sorted(path.glob(f"*{SUFFIX}"), key=lambda profile: profile.stat().st_mtime)
+    for old in profiles[:max(len(profiles) - keep, 0)]:
+        old.unlink(missing_ok=True)
+    return target
+
+
+def wants_profile(scope, app_settings: Settings) -> bool:
+    if app_settings.profile_token:
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return hmac.compare_digest(value, app_settings.profile_token.encode())
+    return app_settings.profile_sample_rate > 0 and random.random() < app_settings.profile_sample_rate
+
+
+class ProfilingMiddleware:
+    # Pure ASGI middleware - requests that are not profiled pass straight through
+    def __init__(self, app, app_settings: Optional[Settings] = None):
+        self.app = app
+        self.settings = app_settings or settings
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not wants_profile(scope, self.settings):
+            await self.app(scope, receive, send)
+            return
+
+        sampler = StackSampler(self.settings.profile_interval_ms / 1000)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            samples = sampler.stop()
+            duration = time.perf_counter() - start
+            name = profile_name(scope["method"], route_template(scope), duration)
+            await run_in_threadpool(write_profile, self.settings.profile_dir, name, samples, self.settings.profile_keep)
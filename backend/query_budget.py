@@ -0,0 +1,171 @@
+"""
+Request-scoped query accounting
+
+Every statement run while a request is being handled is counted and timed
+against that request (SQLAlchemy cursor events + QueryBudgetMiddleware), so
+lazy relationship loads and other N+1 patterns show up:
+
+    - the response carries Server-Timing: db;dur=<ms>;desc="<n> queries"
+    - a SELECT repeated more than settings.n_plus_one_threshold times within one
+      request is logged as a likely N+1
+    - a statement slower than settings.slow_query_ms is logged with its
+      EXPLAIN QUERY PLAN (SQLite)
+
+Tests declare the budget of an endpoint with max_queries:
+
+    with query_budget.max_queries(2):
+        client.get("/tasks", headers=headers)
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+from config import Settings, settings
+
+logger = logging.getLogger("taskmanager.queries")
+
+
+class QueryStats:
+    # Statements run on behalf of one request
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.statements: Counter = Counter()
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        # SELECTs run more than threshold times - the same lazy load once per row
+        return [
+            (statement, count)
+            for statement, count in self.statements.most_common()
+            if count > threshold and statement.lstrip().upper().startswith("SELECT")
+        ]
+
+
+# Stats of the request being handled; sync routes run in the threadpool with a copy of this context
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+# max_queries() blocks waiting for the stats of finished requests
+_listeners: list = []
+_listeners_lock = threading.Lock()
+
+
+def current() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def explain(connection, statement: str, parameters) -> list:
+    # EXPLAIN QUERY PLAN rows for a SELECT on SQLite - run on the raw DBAPI connection so it is not counted
+    if connection.dialect.name != "sqlite" or not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+        return []
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[-1] for row in cursor.fetchall()]
+    except Exception:
+        return []
+    finally:
+        cursor.close()
+
+
+def instrument_engine(sync_engine, app_settings: Settings = settings) -> None:
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("budget_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def record_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["budget_query_start"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.record(statement, elapsed)
+        if app_settings.slow_query_ms and elapsed * 1000 >= app_settings.slow_query_ms:
+            plan = "" if executemany else "\n    ".join(explain(conn, statement, parameters))
+            logger.warning(
+                "slow query (%.1f ms): %s%s", elapsed * 1000, statement, f"\n  plan:\n    {plan}" if plan else ""
+            )
+
+    @event.listens_for(sync_engine, "handle_error")
+    def drop_query_timer(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("budget_query_start"):
+            connection.info["budget_query_start"].pop()
+
+
+def _server_timing(stats: QueryStats) -> bytes:
+    return f'db;dur={stats.total_seconds * 1000:.1f};desc="{stats.count} queries"'.encode()
+
+
+class QueryBudgetMiddleware:
+    # Pure ASGI middleware - opens the per-request stats and reports them when the request is done
+    def __init__(self, app, app_settings: Optional[Settings] = None):
+        self.app = app
+        self.settings = app_settings or settings
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current.set(stats)
+
+        async def send_wrapper(message):
+            # Streaming responses send their headers before all their queries ran - this is the count so far
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"server-timing", _server_timing(stats))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            for statement, count in stats.repeated(self.settings.n_plus_one_threshold):
+                logger.warning(
+                    "possible N+1 in %s %s: statement ran %d times: %s",
+                    scope["method"], scope["path"], count, statement,
+                )
+            with _listeners_lock:
+                listeners = list(_listeners)
+            for listener in listeners:
+                listener(scope, stats)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def max_queries(budget: int):
+    # Test helper - fail if any request finished inside the block ran more than budget statements
+    finished = []
+
+    def listener(scope, stats):
+        finished.append((scope["method"], scope["path"], stats))
+
+    with _listeners_lock:
+        _listeners.append(listener)
+    try:
+        yield finished
+    finally:
+        with _listeners_lock:
+            _listeners.remove(listener)
+    if not finished:
+        raise QueryBudgetExceeded("no request was made inside max_queries()")
+    for method, path, stats in finished:
+        if stats.count > budget:
+            statements = "\n".join(f"  {count}x {statement}" for statement, count in stats.statements.most_common())
+            raise QueryBudgetExceeded(
+                f"{method} {path} ran {stats.count} queries, budget is {budget}:\n{statements}"
+            )
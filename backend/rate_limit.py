@@ -0,0 +1,137 @@
+"""
+In-memory token-bucket rate limiting
+
+Every /login attempt costs a bcrypt verification and every /register a bcrypt
+hash, so one client could otherwise keep the hashing pool busy for everybody.
+Each limited route has token buckets per key (client IP, username or user id):
+a bucket holds up to N tokens, refills at N per period and every request takes
+one. An empty bucket answers 429 with Retry-After set to when the next token
+is due.
+
+Limits are "<count>/<second|minute|hour|day>" strings from the app's settings
+(an empty string turns a limit off); create_app keeps the limiters built from
+them in app.state.rate_limiters. Buckets live in this process only - with several
+workers each enforces its own share. A bucket is a (tokens, updated) pair in
+an LRU dict; once rate_limit_buckets keys are tracked the least recently used
+are dropped - an idle bucket has refilled anyway.
+
+Routes use the dependencies at the bottom, e.g.
+    @router.post("/login", dependencies=[Depends(rate_limit.limit_login)])
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordRequestForm
+
+from config import Settings
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_limit(limit: str) -> Optional[tuple[int, float]]:
+    # "10/minute" -> (10, 60.0); "" -> None (no limit)
+    if not limit.strip():
+        return None
+    count, _, period = limit.partition("/")
+    if period.strip() not in PERIODS or int(count) < 1:
+        raise ValueError(f"invalid rate limit {limit!r} - expected <count>/<second|minute|hour|day>")
+    return int(count), float(PERIODS[period.strip()])
+
+
+class TokenBuckets:
+    def __init__(self, capacity: int, period: float, maxsize: int):
+        self.capacity = capacity
+        self.rate = capacity / period  # tokens per second
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[Hashable, tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: Hashable, now: Optional[float] = None) -> float:
+        # Take a token - 0 if there was one, else the seconds until there will be
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._buckets.pop(key, None)
+            if entry is None:
+                tokens = float(self.capacity)
+            else:
+                tokens = min(self.capacity, entry[0] + (now - entry[1]) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0.0
+            else:
+                retry_after = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RateLimiter:
+    # One limit of one route - None buckets means the limit is turned off
+    def __init__(self, name: str, limit: str, maxsize: int):
+        self.name = name
+        parsed = parse_limit(limit)
+        self.buckets = TokenBuckets(parsed[0], parsed[1], maxsize) if parsed else None
+
+    def check(self, key: Hashable) -> None:
+        if self.buckets is None:
+            return
+        retry_after = self.buckets.take(key)
+        if retry_after > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please retry later",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+
+def build_limiters(app_settings: Settings) -> dict[str, RateLimiter]:
+    # The limiters of one app - all of them off when rate limiting is disabled
+    limits = {
+        "login_ip": app_settings.rate_limit_login_ip,
+        "login_username": app_settings.rate_limit_login_username,
+        "register_ip": app_settings.rate_limit_register_ip,
+        "create_task_user": app_settings.rate_limit_create_task_user,
+        "bulk_task_user": app_settings.rate_limit_bulk_task_user,
+    }
+    return {
+        name: RateLimiter(name, limit if app_settings.rate_limit_enabled else "", app_settings.rate_limit_buckets)
+        for name, limit in limits.items()
+    }
+
+
+def reset(limiters: dict[str, RateLimiter]) -> None:
+    for limiter in limiters.values():
+        if limiter.buckets is not None:
+            limiter.buckets.clear()
+
+
+def client_ip(request: Request) -> str:
+    # The peer address - behind a proxy, run uvicorn with --proxy-headers so this is the real client
+    return request.client.host if request.client else "unknown"
+
+
+# Dependencies - /login and /register in main.py and async_routes.py. The task routes check
+# the "create_task_user" and "bulk_task_user" limiters from their own dependencies, which
+# know the current user.
+
+async def limit_login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()) -> None:
+    # The form is parsed once per request - the login route gets the same instance
+    limiters = request.app.state.rate_limiters
+    limiters["login_ip"].check(client_ip(request))
+    limiters["login_username"].check(form_data.username.lower())
+
+
+async def limit_register(request: Request) -> None:
+    request.app.state.rate_limiters["register_ip"].check(client_ip(request))
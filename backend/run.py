@@ -1,7 +1,9 @@
 """
 Simple launcher for Task Manager Application
-Usage: python run.py
+Usage: python run.py [--reload]
 """
+import sys
+
 import uvicorn
 import webbrowser
 import time
@@ -29,11 +31,13 @@ if __name__ == '__main__':
     # Open browser in background thread
     Timer(2, open_browser).start()
 
-    # Start the FastAPI application.\
+    # Start the FastAPI application - the reloader (a watcher process plus a restart on
+    # every file change) only when asked for
     uvicorn.run(
-        "main:app",
+        "main:create_app",
+        factory=True,
         host="127.0.0.1",
         port=8000,
-        reload=True,
+        reload="--reload" in sys.argv[1:],
         log_level="info"
     )
@@ -1,15 +1,29 @@
-from pydantic import BaseModel, EmailStr, ConfigDict, field_validator
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, ConfigDict, Field, field_validator, model_validator
+from datetime import date, datetime
 from typing import Optional
 from enum import Enum
 
 
+# Largest batch accepted by POST /tasks/bulk
+MAX_BULK_TASKS = 1000
+
+
 class StatusEnum(str, Enum):
     pending = "pending"
     in_progress = "in_progress"
     completed = "completed"
 
 
+class TaskSort(str, Enum):
+    id = "id"
+    due_date = "due_date"
+
+
+class TaskFileFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
 # User Schemas
 class UserBase(BaseModel):
     username: str
@@ -65,11 +79,72 @@ class TaskUpdate(BaseModel):
     status: Optional[StatusEnum] = None
     due_date: Optional[datetime] = None
 
+class TaskBulkCreated(BaseModel):
+    ids: list[int]
+
+
 class TaskUpdateStatus(BaseModel):
     status: StatusEnum
 
 
+# Bulk update / delete - select tasks by id list and/or filter, never "everything" by accident
+class TaskFilter(BaseModel):
+    ids: Optional[list[int]] = Field(None, min_length=1, max_length=10000)
+    status: Optional[StatusEnum] = None
+    due_before: Optional[datetime] = None
+    due_after: Optional[datetime] = None
+
+    @model_validator(mode='after')
+    def validate_not_empty(self):
+        if all(v is None for v in (self.ids, self.status, self.due_before, self.due_after)):
+            raise ValueError('At least one of ids, status, due_before or due_after is required')
+        return self
+
+
+class TaskBulkStatusUpdate(BaseModel):
+    status: StatusEnum
+    filter: TaskFilter
+
+
+class TaskBulkResult(BaseModel):
+    affected: int
+
+
+class TaskImportError(BaseModel):
+    line: int
+    error: str
+
+
+class TaskImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: list[TaskImportError]
+
+
 class Task(TaskBase):
     id: int
     user_id: int
     model_config = ConfigDict(from_attributes=True)
+
+
+# Delta sync - GET /tasks/changes
+class TaskChange(Task):
+    change_seq: int
+    deleted: bool
+
+
+class TaskChanges(BaseModel):
+    changes: list[TaskChange]
+    # Pass back as ?since= (and ?after_id= while has_more) to continue
+    since: int
+    after_id: Optional[int] = None
+    has_more: bool
+
+
+# GET /tasks/stats - overdue and due_today only count tasks that are not completed
+class TaskStats(BaseModel):
+    total: int
+    by_status: dict[StatusEnum, int]
+    overdue: int
+    due_today: int
+    today: date
@@ -0,0 +1,276 @@
+"""
+The frontend, served by the API process under /app
+
+Serving the pages from the same origin as the API means no separate server
+and no CORS preflight before every API call. build() turns frontend/ into a
+build directory:
+
+    - stylesheets, scripts and images get content-hashed names
+      (home.css -> home.3f2a1b9c0d.css) and the pages are rewritten to use them
+    - text files get precompressed .gz siblings, and .br ones when the optional
+      brotli package is installed (pip install brotli)
+    - manifest.json records the hashed files, the encodings available for each
+      file and a content ETag per file and encoding
+    - every build goes to its own directory, named after its content, next to
+      manifest.json; replacing manifest.json is what switches to a new build,
+      so the swap is atomic and several workers can build at once
+
+StaticAssets serves the build: the smallest variant the client accepts,
+Cache-Control immutable for hashed files (a new version has a new name) and
+no-cache plus an ETag for the pages, so a repeat visit costs one 304.
+
+The app builds on startup when the build is missing or older than the sources;
+to build once per deployment instead:
+    python static_assets.py build
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+MANIFEST = "manifest.json"
+# Builds kept besides the current one - workers that have not switched yet still serve them
+KEEP_BUILDS = 2
+# Build directories are named after their content
+_BUILD_NAME = re.compile(r"^[0-9a-f]{16}$")
+# Staging directories older than this were left behind by a build that died
+STALE_STAGING_SECONDS = 3600
+# Referenced from the pages - renamed after their content
+HASHED_SUFFIXES = {".css", ".js", ".png", ".jpg", ".svg", ".ico", ".webp", ".woff2"}
+COMPRESSIBLE_SUFFIXES = {".html", ".css", ".js", ".svg", ".json", ".txt"}
+# Preferred first
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+_REFERENCE = re.compile(r'(\b(?:href|src)=")([^"#?:]+)(")')
+
+
+def _brotli():
+    # brotli is optional - without it only gzip variants are built
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _hashed_name(relative: str, data: bytes) -> str:
+    stem, suffix = posixpath.splitext(relative)
+    return f"{stem}.{_digest(data)[:10]}{suffix}"
+
+
+def _rewrite_references(page: str, page_path: str, renamed: dict[str, str]) -> str:
+    # href="home.css" -> href="home.3f2a1b9c0d.css", relative to the page's own directory
+    base = posixpath.dirname(page_path)
+
+    def replace(match):
+        target = posixpath.normpath(posixpath.join(base, match.group(2)))
+        if target not in renamed:
+            return match.group(0)
+        return match.group(1) + posixpath.relpath(renamed[target], base or ".") + match.group(3)
+
+    return _REFERENCE.sub(replace, page)
+
+
+def _source_files(source: Path, output: Path) -> list[Path]:
+    # Hidden files and directories are skipped, and so is the build itself if it sits inside the sources
+    return sorted(
+        path for path in source.rglob("*")
+        if path.is_file() and output not in path.parents
+        and not any(part.startswith(".") for part in path.relative_to(source).parts)
+    )
+
+
+def build(source_dir: str, output_dir: str) -> dict:
+    # Rebuild output_dir from source_dir and return the manifest
+    source, output = Path(source_dir).resolve(), Path(output_dir).resolve()
+    files = {path.relative_to(source).as_posix(): path.read_bytes() for path in _source_files(source, output)}
+
+    renamed = {
+        relative: _hashed_name(relative, data)
+        for relative, data in files.items()
+        if posixpath.splitext(relative)[1] in HASHED_SUFFIXES
+    }
+    built = {}
+    for relative, data in files.items():
+        if relative.endswith(".html"):
+            data = _rewrite_references(data.decode(), relative, renamed).encode()
+        built[renamed.get(relative, relative)] = data
+
+    output.mkdir(parents=True, exist_ok=True)
+    # Unique per build - several workers may be building at the same time
+    staging = Path(tempfile.mkdtemp(dir=output, prefix=".staging-"))
+    brotli = _brotli()
+    manifest = {"hashed": sorted(renamed.values()), "assets": renamed, "encodings": {}, "etags": {}}
+    for relative, data in built.items():
+        target = staging / relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+        variants = {"identity": data}
+        if posixpath.splitext(relative)[1] in COMPRESSIBLE_SUFFIXES:
+            if brotli is not None:
+                variants["br"] = brotli.compress(data, quality=11)
+            # mtime=0 - the same input always gives the same bytes
+            variants["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+        encodings = []
+        for encoding, body in variants.items():
+            if encoding != "identity":
+                # A variant that saves nothing is not worth the extra file
+                if len(body) >= len(data):
+                    continue
+                target.with_name(target.name + ENCODING_SUFFIXES[encoding]).write_bytes(body)
+                encodings.append(encoding)
+            manifest["etags"][f"{relative}:{encoding}"] = f'"{_digest(body)[:16]}"'
+        manifest["encodings"][relative] = encodings
+    manifest["build"] = _digest(json.dumps(manifest, sort_keys=True).encode())[:16]
+
+    build_path = output / manifest["build"]
+    # mkdtemp makes the directory private to the user building - the server may run as another
+    staging.chmod(0o755)
+    try:
+        staging.rename(build_path)
+    except OSError:
+        # Another worker finished the same build first
+        shutil.rmtree(staging, ignore_errors=True)
+        if not build_path.is_dir():
+            raise
+    _replace_file(output / MANIFEST, json.dumps(manifest, indent=2, sort_keys=True))
+    _prune(output, manifest["build"])
+    return manifest
+
+
+def _replace_file(path: Path, text: str) -> None:
+    # Write next to path and rename over it - readers see the old or the new file, never a partial one
+    fd, temporary = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}-")
+    with os.fdopen(fd, "w") as file:
+        file.write(text)
+    os.chmod(temporary, 0o644)
+    os.replace(temporary, path)
+
+
+def _prune(output: Path, current: str) -> None:
+    # Remove old builds beyond KEEP_BUILDS, dead staging directories and anything else in the way
+    builds = []
+    for path in output.iterdir():
+        if path.name == MANIFEST or path.name == current:
+            continue
+        if path.name.startswith("."):
+            if path.is_dir() and time.time() - path.stat().st_mtime > STALE_STAGING_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+        elif path.is_dir() and _BUILD_NAME.match(path.name):
+            builds.append(path)
+        elif path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+    builds.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in builds[KEEP_BUILDS:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def ensure_built(source_dir: str, output_dir: str) -> None:
+    # Build unless the manifest is newer than every source file
+    manifest = Path(output_dir) / MANIFEST
+    if manifest.exists():
+        built_at = manifest.stat().st_mtime
+        sources = _source_files(Path(source_dir).resolve(), Path(output_dir).resolve())
+        if all(path.stat().st_mtime <= built_at for path in sources):
+            return
+    build(source_dir, output_dir)
+
+
+def accepted_encodings(accept_encoding: str) -> set[str]:
+    # Content codings of an Accept-Encoding header, without those refused with q=0
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+
+class StaticAssets(StaticFiles):
+    # StaticFiles over a build() directory - precompressed variants, immutable hashed files.
+    # Serves the build the manifest named when it was first read.
+    def __init__(self, directory: str):
+        super().__init__(directory=directory, check_dir=False)
+        self._manifest: Optional[dict] = None
+
+    def manifest(self) -> dict:
+        if self._manifest is None:
+            self._manifest = json.loads((Path(self.directory) / MANIFEST).read_text())
+        return self._manifest
+
+    def lookup_path(self, path: str):
+        return super().lookup_path(posixpath.join(self.manifest()["build"], path))
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        manifest = self.manifest()
+        request_headers = Headers(scope=scope)
+        build_path = Path(self.directory).resolve() / manifest["build"]
+        relative = Path(full_path).relative_to(build_path).as_posix()
+        encodings = manifest["encodings"].get(relative, [])
+        media_type, content_encoding = mimetypes.guess_type(relative)
+        if media_type is None or content_encoding is not None:
+            # A .gz / .br variant requested by name is an opaque download
+            media_type = "application/octet-stream"
+
+        headers = {"Cache-Control": IMMUTABLE if relative in manifest["hashed"] else REVALIDATE}
+        if encodings:
+            headers["Vary"] = "Accept-Encoding"
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        encoding = next((encoding for encoding in ENCODING_SUFFIXES if encoding in encodings and encoding in accepted),
+                        "identity")
+        if encoding != "identity":
+            full_path = f"{full_path}{ENCODING_SUFFIXES[encoding]}"
+            stat_result = os.stat(full_path)
+            headers["Content-Encoding"] = encoding
+        etag = manifest["etags"].get(f"{relative}:{encoding}")
+        if etag:
+            headers["ETag"] = etag
+
+        response = FileResponse(
+            full_path, status_code=status_code, stat_result=stat_result, headers=headers, media_type=media_type
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from config import settings
+
+    parser = argparse.ArgumentParser(description="Build the frontend served under /app")
+    parser.add_argument("command", choices=["build"])
+    args = parser.parse_args()
+
+    manifest = build(settings.frontend_dir, settings.frontend_build_dir)
+    print(f"frontend built to {settings.frontend_build_dir} ({len(manifest['encodings'])} files)")
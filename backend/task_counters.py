@@ -0,0 +1,142 @@
+"""
+Per-user task counters behind GET /tasks/stats
+
+task_counters holds the number of live tasks per user, status and due day.
+On SQLite, triggers on the tasks table keep it up to date inside every write
+that inserts, tombstones, deletes or changes the status or due date of a task,
+so the statistics are read from a few counter rows instead of the tasks table
+and the write paths need no extra round trips. Counting by due day rather
+than keeping a single overdue number lets "overdue" and "due today" be
+computed for any day without rewriting counters as time passes.
+
+Other databases compute the statistics from the tasks table.
+
+Recompute the counters from the tasks table with a GROUP BY:
+    python task_counters.py recompute [--user-id ID]
+"""
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import Connection, Date, case, cast, delete, event, func, insert, literal, select, type_coerce
+from sqlalchemy.orm import Session
+
+from models import Task, TaskCounter
+from schemas import StatusEnum
+
+counters = TaskCounter.__table__
+
+_ADD_NEW = (
+    "INSERT INTO task_counters (user_id, status, due_day, count) "
+    "SELECT new.user_id, new.status, date(new.due_date), 1 WHERE new.deleted_at IS NULL "
+    "ON CONFLICT (user_id, status, due_day) DO UPDATE SET count = count + 1;"
+)
+_REMOVE_OLD = (
+    "UPDATE task_counters SET count = count - 1 WHERE old.deleted_at IS NULL "
+    "AND user_id = old.user_id AND status = old.status AND due_day = date(old.due_date); "
+    "DELETE FROM task_counters WHERE user_id = old.user_id AND status = old.status "
+    "AND due_day = date(old.due_date) AND count <= 0;"
+)
+_COUNTER_DDL = [
+    f"CREATE TRIGGER IF NOT EXISTS task_counters_insert AFTER INSERT ON tasks BEGIN {_ADD_NEW} END",
+    f"CREATE TRIGGER IF NOT EXISTS task_counters_delete AFTER DELETE ON tasks BEGIN {_REMOVE_OLD} END",
+    # Tombstoning a task sets deleted_at, so it leaves the counters here too
+    f"CREATE TRIGGER IF NOT EXISTS task_counters_update AFTER UPDATE OF status, due_date, deleted_at ON tasks "
+    f"BEGIN {_REMOVE_OLD} {_ADD_NEW} END",
+]
+
+
+def _due_day(dialect_name: str):
+    # Calendar day of Task.due_date - SQLite stores datetimes as text, so CAST would not work there
+    if dialect_name == "sqlite":
+        return type_coerce(func.date(Task.due_date), Date)
+    return cast(Task.due_date, Date)
+
+
+def stats(db: Session, user_id: int, today: date) -> dict:
+    # Counts by status, plus the open (not completed) tasks due before / on the given day
+    dialect_name = db.get_bind().dialect.name
+    if dialect_name == "sqlite":
+        status, due_day, count = counters.c.status, counters.c.due_day, counters.c.count
+        scope = [counters.c.user_id == user_id]
+    else:
+        status, due_day, count = Task.status, _due_day(dialect_name), literal(1)
+        scope = [Task.user_id == user_id, Task.deleted_at.is_(None)]
+    is_open = status != StatusEnum.completed.value
+    rows = db.execute(
+        select(
+            status,
+            func.sum(count),
+            func.sum(case((is_open & (due_day < today), count), else_=0)),
+            func.sum(case((is_open & (due_day == today), count), else_=0)),
+        )
+        .where(*scope)
+        .group_by(status)
+    ).all()
+    by_status = {task_status: 0 for task_status in StatusEnum}
+    overdue = due_today = 0
+    for task_status, status_count, status_overdue, status_due_today in rows:
+        by_status[StatusEnum(task_status)] = status_count
+        overdue += status_overdue
+        due_today += status_due_today
+    return {
+        "total": sum(by_status.values()),
+        "by_status": by_status,
+        "overdue": overdue,
+        "due_today": due_today,
+        "today": today,
+    }
+
+
+def recompute(connection: Connection, user_id: Optional[int] = None) -> None:
+    # Rebuild the counters of one user (or everybody) from the tasks table
+    day = _due_day(connection.dialect.name)
+    task_scope = [Task.deleted_at.is_(None)]
+    counter_scope = []
+    if user_id is not None:
+        task_scope.append(Task.user_id == user_id)
+        counter_scope.append(counters.c.user_id == user_id)
+    connection.execute(delete(counters).where(*counter_scope))
+    connection.execute(
+        insert(counters).from_select(
+            ["user_id", "status", "due_day", "count"],
+            select(Task.user_id, Task.status, day, func.count())
+            .where(*task_scope)
+            .group_by(Task.user_id, Task.status, day),
+        )
+    )
+
+
+def ensure_counters(connection: Connection) -> None:
+    # Create the triggers if missing, and fill the counters of a database created before they existed
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in _COUNTER_DDL:
+        connection.exec_driver_sql(statement)
+    has_counters = connection.execute(select(counters.c.user_id).limit(1)).first()
+    has_tasks = connection.execute(select(Task.id).where(Task.deleted_at.is_(None)).limit(1)).first()
+    if has_tasks and not has_counters:
+        recompute(connection)
+
+
+@event.listens_for(Task.__table__, "after_create")
+def _create_triggers(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        for statement in _COUNTER_DDL:
+            connection.exec_driver_sql(statement)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import engine, ensure_schema
+
+    parser = argparse.ArgumentParser(description="Maintain the task counters behind GET /tasks/stats")
+    parser.add_argument("command", choices=["recompute"])
+    parser.add_argument("--user-id", type=int, help="only recompute this user's counters")
+    args = parser.parse_args()
+
+    ensure_schema(engine)
+    with engine.begin() as connection:
+        ensure_counters(connection)
+        recompute(connection, args.user_id)
+    print("task_counters recomputed")
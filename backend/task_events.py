@@ -0,0 +1,202 @@
+"""
+Live task change feed - an in-process pub/sub hub and its Server-Sent Events stream
+
+The task write paths in db_interaction publish a "created", "updated" or
+"deleted" event for the owning user once their transaction has committed.
+Every open GET /tasks/events stream of that user receives it.
+
+Event ids are "<boot id>-<sequence>". The last events of each user are kept
+so a client reconnecting with Last-Event-ID gets what it missed. When that is
+not possible (the server restarted, the events fell out of the history, or
+the client could not keep up) the client gets a "reset" event telling it to
+reload its task list instead. The history of a user with no open stream is
+dropped after history_ttl seconds, so memory follows the recently active
+users rather than everyone who ever wrote a task.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Optional
+
+from config import settings
+
+# Sent through a subscriber queue to end its stream
+_CLOSE = object()
+
+
+@dataclass(frozen=True)
+class TaskEvent:
+    id: str
+    seq: int
+    type: str
+    data: dict
+
+    def encode(self) -> bytes:
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data)}\n\n".encode("utf-8")
+
+
+class _Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue_size: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def deliver(self, item) -> None:
+        # Runs on the subscriber's event loop
+        if item is _CLOSE:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(item)
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class TaskEventHub:
+    def __init__(self, history_size: int, queue_size: int, history_ttl: float = 600.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.history_size = history_size
+        self.queue_size = queue_size
+        self.history_ttl = history_ttl
+        self._clock = clock
+        self._seq = itertools.count(1)
+        self._history: dict[int, deque] = {}
+        # Sequence number of the newest event each user's history has dropped
+        self._dropped_upto: dict[int, int] = {}
+        # Newest event of any expired history - a new history cannot replay anything before it
+        self._expired_upto = 0
+        # When each user without subscribers was last active
+        self._idle_since: dict[int, float] = {}
+        self._next_sweep = clock() + history_ttl
+        self._subscribers: dict[int, set[_Subscriber]] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, user_id: int, event_type: str, data: dict) -> None:
+        # Safe to call from any thread - the request threadpool or the event loop
+        with self._lock:
+            seq = next(self._seq)
+            event = TaskEvent(id=f"{self.boot_id}-{seq}", seq=seq, type=event_type, data=data)
+            history = self._history.get(user_id)
+            if history is None:
+                history = self._history[user_id] = deque(maxlen=self.history_size)
+                self._dropped_upto[user_id] = self._expired_upto
+            if len(history) == history.maxlen:
+                self._dropped_upto[user_id] = history[0].seq
+            history.append(event)
+            subscribers = list(self._subscribers.get(user_id, ()))
+            now = self._clock()
+            if not subscribers:
+                self._idle_since[user_id] = now
+            if now >= self._next_sweep:
+                self._expire_idle(now)
+        for subscriber in subscribers:
+            subscriber.loop.call_soon_threadsafe(subscriber.deliver, event)
+
+    def subscribe(self, user_id: int, last_event_id: Optional[str]) -> tuple[_Subscriber, Optional[list[TaskEvent]]]:
+        # Returns the subscriber and the events to replay, or None if the client has to reset
+        subscriber = _Subscriber(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+            self._idle_since.pop(user_id, None)
+            replay = self._replay(user_id, last_event_id)
+        return subscriber, replay
+
+    def unsubscribe(self, user_id: int, subscriber: _Subscriber) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[user_id]
+                    if user_id in self._history:
+                        self._idle_since[user_id] = self._clock()
+
+    def _expire_idle(self, now: float) -> None:
+        # Caller holds the lock. Drops the histories of users idle for longer than history_ttl -
+        # a client resuming from one of their events gets a reset instead of a replay
+        for user_id, idle_since in list(self._idle_since.items()):
+            if now - idle_since >= self.history_ttl:
+                del self._idle_since[user_id]
+                history = self._history.pop(user_id, None)
+                self._dropped_upto.pop(user_id, None)
+                if history:
+                    self._expired_upto = max(self._expired_upto, history[-1].seq)
+        self._next_sweep = now + self.history_ttl / 2
+
+    def close(self) -> None:
+        # End the streams open right now, e.g. on server shutdown. The hub stays usable:
+        # it is shared by every app in the process, and one built later still streams
+        with self._lock:
+            subscribers = [s for group in self._subscribers.values() for s in group]
+        for subscriber in subscribers:
+            subscriber.loop.call_soon_threadsafe(subscriber.deliver, _CLOSE)
+
+    def _replay(self, user_id: int, last_event_id: Optional[str]) -> Optional[list[TaskEvent]]:
+        # Caller holds the lock
+        if not last_event_id:
+            return []
+        boot_id, _, seq = last_event_id.partition("-")
+        if boot_id != self.boot_id or not seq.isdigit():
+            return None
+        last_seq = int(seq)
+        # Events newer than last_seq have already been dropped from the history, or expired with it
+        if last_seq < self._dropped_upto.get(user_id, self._expired_upto):
+            return None
+        return [event for event in self._history.get(user_id, ()) if event.seq > last_seq]
+
+
+hub = TaskEventHub(
+    history_size=settings.sse_history_size,
+    queue_size=settings.sse_queue_size,
+    history_ttl=settings.sse_history_ttl,
+)
+
+
+def publish(user_id: int, event_type: str, ids: list[int], task: Optional[dict] = None) -> None:
+    # Shorthand for the write paths - task is the full task for single-task writes
+    data = {"ids": ids}
+    if task is not None:
+        data["task"] = task
+    hub.publish(user_id, event_type, data)
+
+
+async def stream(event_hub: TaskEventHub, user_id: int, last_event_id: Optional[str],
+                 heartbeat_seconds: float, retry_ms: int) -> AsyncIterator[bytes]:
+    # The body of a text/event-stream response
+    subscriber, replay = event_hub.subscribe(user_id, last_event_id)
+    try:
+        yield f"retry: {retry_ms}\n\n".encode("utf-8")
+        if replay is None:
+            yield b"event: reset\ndata: {}\n\n"
+        else:
+            for event in replay:
+                yield event.encode()
+
+        while True:
+            try:
+                item = await asyncio.wait_for(subscriber.queue.get(), timeout=heartbeat_seconds)
+            except asyncio.TimeoutError:
+                # Comment line - keeps proxies from closing an idle connection
+                yield b": ping\n\n"
+                continue
+            if item is _CLOSE:
+                return
+            if subscriber.overflowed:
+                # The client fell behind - drop what is queued and make it reload
+                subscriber.overflowed = False
+                while not subscriber.queue.empty():
+                    if subscriber.queue.get_nowait() is _CLOSE:
+                        return
+                yield b"event: reset\ndata: {}\n\n"
+                continue
+            yield item.encode()
+    finally:
+        event_hub.unsubscribe(user_id, subscriber)
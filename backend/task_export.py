@@ -0,0 +1,61 @@
+"""
+Streaming export of a user's tasks
+
+Rows are read from the database in batches (yield_per) and encoded batch by
+batch, so memory use stays flat however many tasks the user has.
+"""
+import csv
+import io
+from typing import Iterator
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import Task
+import schemas
+
+# Rows fetched from the cursor, and encoded into one chunk of the response, at a time
+EXPORT_BATCH_SIZE = 500
+
+CSV_COLUMNS = ["id", "title", "description", "status", "due_date", "user_id"]
+
+
+def _iter_task_batches(db: Session, user_id: int) -> Iterator[list[Task]]:
+    stmt = (
+        select(Task)
+        .where(Task.user_id == user_id, Task.deleted_at.is_(None))
+        .order_by(Task.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    # The session's identity map only holds weak references, so rows from finished
+    # batches are released as soon as they have been encoded
+    yield from db.execute(stmt).scalars().partitions()
+
+
+def iter_ndjson(db: Session, user_id: int) -> Iterator[bytes]:
+    # One JSON object per line, same fields as GET /tasks
+    for batch in _iter_task_batches(db, user_id):
+        lines = [schemas.Task.model_validate(task).model_dump_json() for task in batch]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def iter_csv(db: Session, user_id: int) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for batch in _iter_task_batches(db, user_id):
+        for task in batch:
+            writer.writerow([
+                task.id,
+                task.title,
+                task.description if task.description is not None else "",
+                task.status,
+                task.due_date.isoformat(),
+                task.user_id,
+            ])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for a user without tasks
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
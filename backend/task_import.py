@@ -0,0 +1,175 @@
+"""
+Streaming import of tasks from NDJSON or CSV uploads
+
+The request body is decoded and split into records as it arrives. Each record
+is validated against schemas.TaskCreate on its own; valid rows are inserted in
+chunks (one transaction per chunk) and invalid rows are reported by line
+number instead of failing the whole upload.
+"""
+import codecs
+import csv
+from typing import AsyncIterator, Iterator, Optional, Union
+
+import anyio.from_thread
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+import db_interaction
+import schemas
+
+# At most this many row errors are listed in the report - the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+# Longest CSV record, quotes and line breaks included. A quoted field that is never closed would
+# otherwise run on to the end of the body. Kept at csv's default field size limit, so that limit
+# cannot cut a record in two first
+MAX_CSV_RECORD_CHARS = 128 * 1024
+
+# CSV columns that map onto TaskCreate fields; any other column (e.g. id from an export) is ignored
+CSV_FIELDS = ("title", "description", "status", "due_date")
+
+
+def iter_lines(chunks: AsyncIterator[bytes]) -> Iterator[str]:
+    # Every line of the body, line break included, split across chunk boundaries.
+    # Runs on a worker thread and fetches each chunk from the event loop
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    while True:
+        try:
+            chunk = anyio.from_thread.run(chunks.__anext__)
+        except StopAsyncIteration:
+            break
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+class _RecordTooLong(Exception):
+    pass
+
+
+def iter_csv_records(lines: Iterator[str]) -> Iterator[tuple[int, Union[list[str], csv.Error]]]:
+    # (first line number, fields) for every CSV record, or the csv.Error of a record that could
+    # not be read. One reader parses the whole body: quoted fields may span lines, and a quote
+    # inside an unquoted field (5" screen) is an ordinary character
+    record_chars = 0
+
+    def feed():
+        nonlocal record_chars
+        for line in lines:
+            record_chars += len(line)
+            if record_chars > MAX_CSV_RECORD_CHARS:
+                raise _RecordTooLong
+            yield line
+
+    reader = csv.reader(feed())
+    while True:
+        start = reader.line_num + 1
+        record_chars = 0
+        try:
+            yield start, next(reader)
+        except StopIteration:
+            return
+        except csv.Error as exc:
+            yield start, exc
+        except _RecordTooLong:
+            # Nothing after an unclosed quote can be told apart from the quoted text - stop here
+            yield start, csv.Error(
+                f"record is longer than {MAX_CSV_RECORD_CHARS} characters (unclosed quote?); "
+                "the rest of the body was not imported"
+            )
+            return
+
+
+def _error_message(exc: Exception) -> str:
+    if isinstance(exc, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}"
+            for error in exc.errors()
+        )
+    return str(exc)
+
+
+class _ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors: list[dict] = []
+
+    def add_error(self, line: int, exc: Exception):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": _error_message(exc)})
+
+    def as_dict(self) -> dict:
+        return {"imported": self.imported, "failed": self.failed, "errors": self.errors}
+
+
+async def import_tasks(
+        chunks: AsyncIterator[bytes],
+        file_format: schemas.TaskFileFormat,
+        db: Session,
+        user_id: int,
+        chunk_size: int,
+) -> dict:
+    # Parsing, validation and the inserts run on a worker thread, which reads the body as it arrives
+    return await run_in_threadpool(_import_lines, iter_lines(chunks), file_format, db, user_id, chunk_size)
+
+
+def _import_lines(
+        lines: Iterator[str],
+        file_format: schemas.TaskFileFormat,
+        db: Session,
+        user_id: int,
+        chunk_size: int,
+) -> dict:
+    report = _ImportReport()
+    pending: list[schemas.TaskCreate] = []
+
+    def flush():
+        if pending:
+            db_interaction.create_tasks_bulk(db, list(pending), user_id)
+            report.imported += len(pending)
+            pending.clear()
+
+    if file_format == schemas.TaskFileFormat.csv:
+        records = iter_csv_records(lines)
+    else:
+        records = enumerate((line.rstrip("\r\n") for line in lines), start=1)
+    header: Optional[list[str]] = None
+
+    for line_no, record in records:
+        try:
+            if file_format == schemas.TaskFileFormat.csv:
+                if isinstance(record, csv.Error):
+                    raise record
+                # Blank line
+                if len(record) <= 1 and not "".join(record).strip():
+                    continue
+                if header is None:
+                    header = [name.strip() for name in record]
+                    continue
+                row = {name: value for name, value in zip(header, record) if name in CSV_FIELDS}
+                # An empty description cell means no description
+                if not row.get("description"):
+                    row["description"] = None
+                task = schemas.TaskCreate.model_validate(row)
+            else:
+                if not record.strip():
+                    continue
+                task = schemas.TaskCreate.model_validate_json(record)
+        except (ValidationError, csv.Error) as exc:
+            report.add_error(line_no, exc)
+            continue
+
+        pending.append(task)
+        if len(pending) >= chunk_size:
+            flush()
+
+    flush()
+    return report.as_dict()
@@ -0,0 +1,47 @@
+"""
+Fast JSON path for task list responses
+
+The default FastAPI path turns every ORM row into a schemas.Task (validation
+with from_attributes) and then serializes that model. List endpoints instead
+select only the columns of schemas.Task and serialize the rows straight to
+bytes with pydantic-core, skipping ORM objects and the validation pass.
+
+Routes keep their response_model, so the OpenAPI schema does not change;
+returning a TaskJSONResponse makes FastAPI send it as is.
+"""
+from typing import Any, Iterable, Optional
+
+from fastapi.responses import Response
+from pydantic_core import to_json
+from sqlalchemy import Row
+
+from models import Task
+import schemas
+
+# Columns of schemas.Task, in the field order of the default response
+TASK_FIELDS = tuple(schemas.Task.model_fields)
+TASK_COLUMNS = tuple(getattr(Task, field) for field in TASK_FIELDS)
+
+
+class TaskJSONResponse(Response):
+    # JSON response whose content is already serialized (bytes) or plain data for to_json
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return to_json(content)
+
+
+def task_columns(stmt):
+    # Narrow a select(Task) statement to the response columns - rows instead of ORM objects
+    return stmt.with_only_columns(*TASK_COLUMNS)
+
+
+def dump_tasks(rows: Iterable[Row]) -> bytes:
+    # Rows selected with task_columns(); the values are already what schemas.Task would hold
+    return to_json([row._asdict() for row in rows])
+
+
+def task_list_response(rows: Iterable[Row], headers: Optional[dict] = None) -> TaskJSONResponse:
+    return TaskJSONResponse(dump_tasks(rows), headers=headers)
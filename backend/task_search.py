@@ -0,0 +1,119 @@
+"""
+Full-text search over task titles and descriptions
+
+On SQLite the tasks table is indexed by an FTS5 external-content table,
+tasks_fts, that stores only the index - the text itself stays in tasks.
+Triggers keep it in sync with every write path (single, bulk and import
+inserts, updates, deletes), and matches are ranked with bm25, title hits
+weighted above description hits.
+
+Other databases fall back to a LIKE scan ordered by id.
+
+Rebuild the index from the tasks table (e.g. after restoring a backup):
+    python task_search.py rebuild
+"""
+import re
+from typing import Optional
+
+from sqlalchemy import Connection, column, event, func, or_, select, table
+from sqlalchemy.sql import Select
+
+from models import Task
+
+FTS_TABLE = "tasks_fts"
+# bm25 column weights - a hit in the title counts ten times a hit in the description
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+_FTS_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, description, content='tasks', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) "
+    f"VALUES ('delete', old.id, old.title, old.description); END",
+    # Status changes and tombstones do not touch the text, so only title / description updates reindex
+    f"CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF title, description ON tasks BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) "
+    f"VALUES ('delete', old.id, old.title, old.description); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+]
+
+tasks_fts = table(FTS_TABLE, column("rowid"), column(FTS_TABLE))
+
+
+def ensure_index(connection: Connection) -> None:
+    # Create the index and its triggers if missing, filling it from the existing tasks
+    if connection.dialect.name != "sqlite":
+        return
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).first()
+    for statement in _FTS_DDL:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        rebuild(connection)
+
+
+def rebuild(connection: Connection) -> None:
+    # Throw the index away and rebuild it from the tasks table
+    connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+@event.listens_for(Task.__table__, "after_create")
+def _create_index(target, connection, **kw):
+    ensure_index(connection)
+
+
+@event.listens_for(Task.__table__, "before_drop")
+def _drop_index(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def match_query(q: str) -> Optional[str]:
+    # Turn user input into an FTS5 query: every word must match, as a prefix ("rep" finds "report").
+    # Words are quoted so operators and punctuation in the input are never parsed as FTS syntax.
+    terms = re.findall(r"\w+", q)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_statement(dialect_name: str, user_id: int, q: str, limit: int, offset: int) -> Optional[Select]:
+    # One page of the user's live tasks matching q, best match first; fetches one extra row
+    # so the caller can tell if there is a next page. None if q has nothing to search for.
+    query = match_query(q)
+    if query is None:
+        return None
+    stmt = select(Task).where(Task.user_id == user_id, Task.deleted_at.is_(None))
+    if dialect_name == "sqlite":
+        fts_column = tasks_fts.c[FTS_TABLE]
+        stmt = (
+            stmt.join(tasks_fts, tasks_fts.c.rowid == Task.id)
+            .where(fts_column.match(query))
+            .order_by(func.bm25(fts_column, TITLE_WEIGHT, DESCRIPTION_WEIGHT), Task.id)
+        )
+    else:
+        for term in re.findall(r"\w+", q):
+            pattern = f"%{term}%"
+            stmt = stmt.where(or_(Task.title.ilike(pattern), Task.description.ilike(pattern)))
+        stmt = stmt.order_by(Task.id)
+    return stmt.limit(limit + 1).offset(offset)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import engine, ensure_schema
+
+    parser = argparse.ArgumentParser(description="Maintain the task search index")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    ensure_schema(engine)
+    with engine.begin() as connection:
+        ensure_index(connection)
+        rebuild(connection)
+    print(f"{FTS_TABLE} rebuilt")
@@ -7,6 +7,11 @@ from datetime import datetime, timedelta
 
 from main import app, get_db
 from database import Base
+from models import User
+import schemas
+import principal_cache
+import query_budget
+import rate_limit
 
 # Use a proper in-memory SQLite database for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -17,18 +22,27 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base.metadata.create_all(bind=engine)
+query_budget.instrument_engine(engine)
 
 
-def test_original_get_db():
-    """Test the original get_db function"""
-    from main import get_db
-    db_gen = get_db()
-    db = next(db_gen)
-    assert db is not None
-    try:
-        next(db_gen)
-    except StopIteration:
-        pass
+def test_original_get_db(tmp_path):
+    """Test the original get_db function - sessions come from the app's own database"""
+    from config import Settings
+    from main import create_app
+
+    database_url = f"sqlite:///{tmp_path / 'app.db'}"
+    with TestClient(create_app(Settings(database_url=database_url, serve_frontend=False))) as app_client:
+        response = app_client.post(
+            "/register", json={"username": "owndb", "email": "owndb@example.com", "password": "owndbpass"}
+        )
+        assert response.status_code == 201
+    file_engine = create_engine(database_url)
+    with file_engine.connect() as connection:
+        assert connection.exec_driver_sql("SELECT username FROM users").scalars().all() == ["owndb"]
+    db = TestingSessionLocal()
+    assert db.query(User).filter(User.username == "owndb").first() is None
+    db.close()
+    file_engine.dispose()
 
 
 def override_get_db():
@@ -48,6 +62,8 @@ def setup_database():
     Base.metadata.create_all(bind=engine)
     yield
     Base.metadata.drop_all(bind=engine)
+    principal_cache.cache.clear()
+    rate_limit.reset(app.state.rate_limiters)
 
 
 @pytest.fixture
@@ -498,4 +514,1507 @@ def test_cors_multiple_headers():
     )
 
     assert response.status_code in [200, 204]
-    assert "access-control-allow-headers" in response.headers or "access-control-allow-origin" in response.headers
\ No newline at end of file
+    assert "access-control-allow-headers" in response.headers or "access-control-allow-origin" in response.headers
+
+# ============================================
+# PAGINATION TESTS
+# ============================================
+
+def _create_tasks(auth_headers, count, status="pending"):
+    base = datetime.now() + timedelta(days=1)
+    ids = []
+    for i in range(count):
+        response = client.post(
+            "/tasks",
+            json={
+                "title": f"Task {i}",
+                "status": status,
+                # Due dates in reverse creation order so id and due_date sorts differ
+                "due_date": (base + timedelta(days=count - i)).isoformat()
+            },
+            headers=auth_headers
+        )
+        ids.append(response.json()["id"])
+    return ids
+
+
+def test_read_tasks_paginates_with_cursor(auth_headers):
+    ids = _create_tasks(auth_headers, 5)
+
+    first = client.get("/tasks?limit=2", headers=auth_headers)
+    assert first.status_code == 200
+    assert [t["id"] for t in first.json()] == ids[:2]
+    cursor = first.headers["x-next-cursor"]
+
+    second = client.get("/tasks", params={"limit": 2, "cursor": cursor}, headers=auth_headers)
+    assert [t["id"] for t in second.json()] == ids[2:4]
+
+    last = client.get("/tasks", params={"limit": 2, "cursor": second.headers["x-next-cursor"]},
+                      headers=auth_headers)
+    assert [t["id"] for t in last.json()] == ids[4:]
+    assert "x-next-cursor" not in last.headers
+
+
+def test_read_tasks_sort_by_due_date(auth_headers):
+    ids = _create_tasks(auth_headers, 3)
+
+    first = client.get("/tasks?sort=due_date&limit=2", headers=auth_headers)
+    assert [t["id"] for t in first.json()] == [ids[2], ids[1]]
+
+    rest = client.get("/tasks", params={"sort": "due_date", "cursor": first.headers["x-next-cursor"]},
+                      headers=auth_headers)
+    assert [t["id"] for t in rest.json()] == [ids[0]]
+
+
+def test_read_tasks_filters(auth_headers):
+    _create_tasks(auth_headers, 2, status="pending")
+    completed = _create_tasks(auth_headers, 1, status="completed")
+
+    response = client.get("/tasks?status=completed", headers=auth_headers)
+    assert [t["id"] for t in response.json()] == completed
+
+    cutoff = (datetime.now() + timedelta(days=2, hours=12)).isoformat()
+    response = client.get("/tasks", params={"due_before": cutoff}, headers=auth_headers)
+    assert len(response.json()) == 2
+    response = client.get("/tasks", params={"due_after": cutoff}, headers=auth_headers)
+    assert len(response.json()) == 1
+
+
+def test_read_tasks_invalid_cursor(auth_headers):
+    response = client.get("/tasks?cursor=not-a-cursor", headers=auth_headers)
+    assert response.status_code == 400
+
+    _create_tasks(auth_headers, 2)
+    cursor = client.get("/tasks?limit=1", headers=auth_headers).headers["x-next-cursor"]
+    response = client.get("/tasks", params={"sort": "due_date", "cursor": cursor}, headers=auth_headers)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("sort", [schemas.TaskSort.id, schemas.TaskSort.due_date])
+@pytest.mark.parametrize("status", [None, schemas.StatusEnum.pending])
+def test_task_page_reads_in_index_order(sort, status):
+    # Every page must be an index range scan - a temp b-tree sort would read all of the user's rows
+    import pagination
+
+    stmt = pagination.task_page_statement(1, 10, sort=sort, status=status)
+    sql = str(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as connection:
+        plan = [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+    assert not any("TEMP B-TREE" in step for step in plan), plan
+
+
+# ============================================
+# BULK TESTS
+# ============================================
+
+def test_create_tasks_bulk(auth_headers):
+    due_date = (datetime.now() + timedelta(days=7)).isoformat()
+    payload = [
+        {"title": f"Bulk {i}", "status": "pending", "due_date": due_date}
+        for i in range(3)
+    ]
+    response = client.post("/tasks/bulk", json=payload, headers=auth_headers)
+    assert response.status_code == 201
+    ids = response.json()["ids"]
+    assert len(ids) == 3
+
+    tasks = client.get("/tasks", headers=auth_headers).json()
+    assert [t["id"] for t in tasks] == ids
+    assert [t["title"] for t in tasks] == ["Bulk 0", "Bulk 1", "Bulk 2"]
+
+
+def test_create_tasks_bulk_is_all_or_nothing(auth_headers):
+    due_date = (datetime.now() + timedelta(days=7)).isoformat()
+    payload = [
+        {"title": "Good", "status": "pending", "due_date": due_date},
+        {"title": "Bad", "status": "invalid_status", "due_date": due_date},
+    ]
+    response = client.post("/tasks/bulk", json=payload, headers=auth_headers)
+    assert response.status_code == 422
+    assert client.get("/tasks", headers=auth_headers).json() == []
+
+
+def test_create_tasks_bulk_rejects_empty_list(auth_headers):
+    response = client.post("/tasks/bulk", json=[], headers=auth_headers)
+    assert response.status_code == 422
+
+
+def test_update_status_bulk(auth_headers):
+    ids = _create_tasks(auth_headers, 3)
+
+    response = client.patch(
+        "/tasks/status",
+        json={"status": "completed", "filter": {"ids": ids[:2]}},
+        headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert response.json() == {"affected": 2}
+
+    statuses = {t["id"]: t["status"] for t in client.get("/tasks", headers=auth_headers).json()}
+    assert statuses == {ids[0]: "completed", ids[1]: "completed", ids[2]: "pending"}
+
+
+def test_delete_tasks_bulk_by_filter(auth_headers):
+    _create_tasks(auth_headers, 2, status="pending")
+    _create_tasks(auth_headers, 3, status="completed")
+
+    response = client.request(
+        "DELETE", "/tasks",
+        json={"status": "completed", "due_before": (datetime.now() + timedelta(days=30)).isoformat()},
+        headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert response.json() == {"affected": 3}
+    assert len(client.get("/tasks", headers=auth_headers).json()) == 2
+
+
+def test_bulk_operations_require_a_filter(auth_headers):
+    _create_tasks(auth_headers, 1)
+    response = client.request("DELETE", "/tasks", json={}, headers=auth_headers)
+    assert response.status_code == 422
+    assert len(client.get("/tasks", headers=auth_headers).json()) == 1
+
+
+def test_bulk_operations_only_touch_own_tasks(auth_headers):
+    ids = _create_tasks(auth_headers, 1)
+    client.post("/register", json={"username": "other", "email": "other@example.com", "password": "otherpass"})
+    token = client.post("/login", data={"username": "other", "password": "otherpass"}).json()["access_token"]
+
+    response = client.request("DELETE", "/tasks", json={"ids": ids},
+                              headers={"Authorization": f"Bearer {token}"})
+    assert response.json() == {"affected": 0}
+    assert len(client.get("/tasks", headers=auth_headers).json()) == 1
+
+
+# ============================================
+# ASYNC MODE TESTS
+# ============================================
+
+@pytest.fixture
+def async_client(tmp_path):
+    """Client for the async route set, on its own aiosqlite database"""
+    pytest.importorskip("aiosqlite")
+    from fastapi import FastAPI
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from sqlalchemy.pool import NullPool
+    from config import Settings
+    import async_routes
+
+    db_file = tmp_path / "async_test.db"
+    Base.metadata.create_all(bind=create_engine(f"sqlite:///{db_file}"))
+    async_session = async_sessionmaker(
+        create_async_engine(f"sqlite+aiosqlite:///{db_file}", poolclass=NullPool),
+        expire_on_commit=False,
+    )
+
+    async def override_get_async_db():
+        async with async_session() as db:
+            yield db
+
+    async_app = FastAPI()
+    async_app.state.rate_limiters = rate_limit.build_limiters(Settings())
+    async_app.include_router(async_routes.router)
+    async_app.dependency_overrides[async_routes.get_async_db] = override_get_async_db
+    with TestClient(async_app) as test_client:
+        yield test_client
+
+
+def test_async_routes_task_lifecycle(async_client):
+    response = async_client.post(
+        "/register",
+        json={"username": "asyncuser", "email": "async@example.com", "password": "asyncpass"}
+    )
+    assert response.status_code == 201
+    response = async_client.post("/login", data={"username": "asyncuser", "password": "wrongpass"})
+    assert response.status_code == 401
+    token = async_client.post(
+        "/login", data={"username": "asyncuser", "password": "asyncpass"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert async_client.get("/users/me", headers=headers).json()["username"] == "asyncuser"
+
+    due_date = (datetime.now() + timedelta(days=7)).isoformat()
+    task_id = async_client.post(
+        "/tasks", json={"title": "Async", "status": "pending", "due_date": due_date}, headers=headers
+    ).json()["id"]
+    ids = async_client.post(
+        "/tasks/bulk", json=[{"title": "Bulk", "status": "pending", "due_date": due_date}] * 2, headers=headers
+    ).json()["ids"]
+    assert len(async_client.get("/tasks", headers=headers).json()) == 3
+
+    response = async_client.patch(f"/tasks/{task_id}/status", json={"status": "completed"}, headers=headers)
+    assert response.json()["status"] == "completed"
+    response = async_client.request("DELETE", "/tasks", json={"ids": ids}, headers=headers)
+    assert response.json() == {"affected": 2}
+    assert async_client.delete(f"/tasks/{task_id}", headers=headers).status_code == 200
+    assert async_client.get(f"/tasks/{task_id}", headers=headers).status_code == 404
+
+
+# ============================================
+# PASSWORD HASHING POOL TESTS
+# ============================================
+
+def test_login_returns_503_when_hashing_pool_is_full(test_user, monkeypatch):
+    import password_hashing
+    full_pool = password_hashing.PasswordHashingPool(workers=1, queue_size=0, timeout=5)
+    full_pool._slots.acquire()  # the only slot is taken by another login
+    monkeypatch.setattr(password_hashing, "pool", full_pool)
+
+    response = client.post(
+        "/login",
+        data={"username": test_user["username"], "password": test_user["password"]}
+    )
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_hashing_pool_round_trip():
+    import password_hashing
+    hashed = password_hashing.hash_password("secret-password")
+    assert password_hashing.verify_password("secret-password", hashed)
+    assert not password_hashing.verify_password("other-password", hashed)
+
+
+def test_hashing_pool_recovers_from_dead_worker():
+    import os
+    import password_hashing
+    pool = password_hashing.PasswordHashingPool(workers=1, queue_size=1, timeout=30)
+    policy = password_hashing.HashingPolicy(bcrypt_rounds=4)
+    try:
+        # The worker process exits mid-job, as if it was killed - a 503 for this call only
+        with pytest.raises(password_hashing.PasswordHashingBusy):
+            pool.run(os._exit, 1)
+        hashed = pool.run(password_hashing._hash, "secret-password", policy)
+        assert pool.run(password_hashing._verify, "secret-password", hashed, policy)
+    finally:
+        pool.shutdown()
+
+
+def test_hashing_workers_do_not_import_the_main_script(tmp_path):
+    import os
+    import subprocess
+    import sys
+
+    # A debug script without a __main__ guard - each run of its body adds a line to runs.txt
+    script = tmp_path / "register_and_login.py"
+    script.write_text(
+        "from fastapi.testclient import TestClient\n"
+        "from main import app\n"
+        "with open('runs.txt', 'a') as runs:\n"
+        "    runs.write('run\\n')\n"
+        "with TestClient(app) as client:\n"
+        "    credentials = {'username': 'scriptuser', 'password': 'scriptpass'}\n"
+        "    print(client.post('/register', json={**credentials, 'email': 'script@example.com'}).status_code)\n"
+        "    print(client.post('/login', data=credentials).status_code)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, str(script)],
+        cwd=tmp_path,
+        env={
+            **os.environ,
+            "PYTHONPATH": os.path.dirname(os.path.abspath(__file__)),
+            "TASKMANAGER_DATABASE_URL": f"sqlite:///{tmp_path / 'script.db'}",
+            "TASKMANAGER_BCRYPT_ROUNDS": "4",
+            "TASKMANAGER_SERVE_FRONTEND": "false",
+        },
+        capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["201", "200"]
+    # The hashing workers started without running the script again
+    assert (tmp_path / "runs.txt").read_text() == "run\n"
+
+
+def test_hashing_policy_needs_update():
+    import password_hashing
+    policy = password_hashing.HashingPolicy(bcrypt_rounds=4)
+    hashed = password_hashing._hash("secret-password", policy)
+    assert hashed.startswith("$2b$04$")
+    assert not password_hashing.needs_update(hashed, policy)
+    assert password_hashing.needs_update(hashed, password_hashing.HashingPolicy(bcrypt_rounds=5))
+    assert password_hashing.needs_update(hashed, password_hashing.HashingPolicy(scheme="argon2"))
+    with pytest.raises(ValueError):
+        password_hashing.HashingPolicy(scheme="md5")
+
+
+def test_login_rehashes_below_policy(monkeypatch):
+    import password_hashing
+    monkeypatch.setattr(password_hashing, "policy", password_hashing.HashingPolicy(bcrypt_rounds=4))
+    client.post("/register", json={"username": "rehash", "email": "rehash@example.com", "password": "rehashpass"})
+
+    def stored_hash():
+        db = TestingSessionLocal()
+        try:
+            return db.query(User).filter(User.username == "rehash").one().hashed_password
+        finally:
+            db.close()
+
+    old_hash = stored_hash()
+    assert old_hash.startswith("$2b$04$")
+
+    # A failed login leaves the hash alone
+    monkeypatch.setattr(password_hashing, "policy", password_hashing.HashingPolicy(bcrypt_rounds=5))
+    assert client.post("/login", data={"username": "rehash", "password": "wrong-pass"}).status_code == 401
+    assert stored_hash() == old_hash
+
+    assert client.post("/login", data={"username": "rehash", "password": "rehashpass"}).status_code == 200
+    new_hash = stored_hash()
+    assert new_hash.startswith("$2b$05$")
+    assert client.post("/login", data={"username": "rehash", "password": "rehashpass"}).status_code == 200
+    assert stored_hash() == new_hash
+
+
+# ============================================
+# PRINCIPAL CACHE TESTS
+# ============================================
+
+def test_current_user_is_served_from_cache(auth_headers):
+    from sqlalchemy import event
+    assert client.get("/users/me", headers=auth_headers).status_code == 200
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        response = client.get("/users/me", headers=auth_headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert response.status_code == 200
+    assert response.json()["username"] == "testuser"
+    assert statements == []
+
+
+def test_principal_cache_invalidated_on_user_change(auth_headers):
+    client.get("/users/me", headers=auth_headers)
+    assert len(principal_cache.cache) == 1
+
+    db = TestingSessionLocal()
+    user = db.query(User).filter(User.username == "testuser").first()
+    user.email = "changed@example.com"
+    db.commit()
+    db.close()
+    assert len(principal_cache.cache) == 0
+    assert client.get("/users/me", headers=auth_headers).json()["email"] == "changed@example.com"
+
+
+def test_principal_cache_evicts_least_recently_used():
+    cache = principal_cache.PrincipalCache(maxsize=2, ttl=60)
+    far_future = 4102444800
+    for i in range(3):
+        cache.put(f"token-{i}", User(id=i, username=f"u{i}", email=f"u{i}@example.com"), far_future)
+    assert cache.get("token-0") is None
+    assert cache.get("token-2").username == "u2"
+
+    expired = principal_cache.PrincipalCache(maxsize=2, ttl=60)
+    expired.put("old", User(id=1, username="u", email="u@example.com"), 0)
+    assert expired.get("old") is None
+
+
+# ============================================
+# DATABASE PROFILE TESTS
+# ============================================
+
+def test_sqlite_connection_profile(tmp_path):
+    from sqlalchemy import text
+    from database import configure_sqlite, engine_options
+
+    url = f"sqlite:///{tmp_path / 'profile.db'}"
+    file_engine = create_engine(url, **engine_options(url))
+    configure_sqlite(file_engine)
+    with file_engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert conn.execute(text("PRAGMA temp_store")).scalar() == 2  # MEMORY
+    file_engine.dispose()
+
+    # No SELECT 1 on every checkout of a local file - only network databases are pinged
+    assert "pool_pre_ping" not in engine_options(url)
+    assert engine_options("postgresql://db.example/tasks")["pool_pre_ping"] is True
+
+
+# ============================================
+# EXPORT TESTS
+# ============================================
+
+def test_export_tasks_ndjson(auth_headers, monkeypatch):
+    import json
+    import task_export
+    monkeypatch.setattr(task_export, "EXPORT_BATCH_SIZE", 2)  # several batches
+    ids = _create_tasks(auth_headers, 5)
+
+    response = client.get("/tasks/export", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == ids
+    assert rows[0]["title"] == "Task 0"
+
+
+def test_export_tasks_csv(auth_headers):
+    import csv
+    import io
+    ids = _create_tasks(auth_headers, 3)
+
+    response = client.get("/tasks/export?format=csv", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [int(row["id"]) for row in rows] == ids
+    assert rows[0]["status"] == "pending"
+
+
+def test_export_tasks_csv_empty(auth_headers):
+    response = client.get("/tasks/export?format=csv", headers=auth_headers)
+    assert response.text.strip() == "id,title,description,status,due_date,user_id"
+
+
+# ============================================
+# IMPORT TESTS
+# ============================================
+
+def test_import_tasks_ndjson_reports_bad_lines(auth_headers, monkeypatch):
+    import json
+    from config import settings
+    monkeypatch.setattr(settings, "import_chunk_size", 2)  # several commits
+    due_date = (datetime.now() + timedelta(days=7)).isoformat()
+    lines = [json.dumps({"title": f"Imported {i}", "status": "pending", "due_date": due_date}) for i in range(5)]
+    lines.insert(2, json.dumps({"title": "Bad", "status": "nope", "due_date": due_date}))
+    lines.insert(4, "{not json")
+    body = "\n".join(lines) + "\n\n"
+
+    response = client.post("/tasks/import", content=body.encode(), headers=auth_headers)
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] == 5
+    assert report["failed"] == 2
+    assert [error["line"] for error in report["errors"]] == [3, 5]
+    assert "status" in report["errors"][0]["error"]
+    assert len(client.get("/tasks", headers=auth_headers).json()) == 5
+
+
+def test_import_tasks_csv(auth_headers):
+    due_date = (datetime.now() + timedelta(days=7)).isoformat()
+    body = (
+        "id,title,description,status,due_date,user_id\n"
+        f'1,First,,pending,{due_date},99\n'
+        f'2,Second,"multi\nline, with comma",completed,{due_date},99\n'
+        f'3,Third,,pending,not-a-date,99\n'
+    )
+    response = client.post("/tasks/import?format=csv", content=body.encode(), headers=auth_headers)
+    report = response.json()
+    assert report["imported"] == 2
+    assert [error["line"] for error in report["errors"]] == [5]
+
+    tasks = client.get("/tasks", headers=auth_headers).json()
+    assert [t["title"] for t in tasks] == ["First", "Second"]
+    assert tasks[0]["description"] is None
+    assert tasks[1]["description"] == "multi\nline, with comma"
+    assert tasks[1]["status"] == "completed"
+
+
+def test_import_tasks_csv_stray_and_unclosed_quotes(auth_headers, monkeypatch):
+    import task_import
+    monkeypatch.setattr(task_import, "MAX_CSV_RECORD_CHARS", 1000)
+    due_date = (datetime.now() + timedelta(days=7)).isoformat()
+    rows = [f"Task {i},pending,{due_date}" for i in range(6)]
+    body = "\n".join(
+        ["title,status,due_date", f'5" screen,pending,{due_date}', *rows, f'"Unclosed,pending,{due_date}', *rows * 20]
+    ) + "\n"
+    response = client.post("/tasks/import?format=csv", content=body.encode(), headers=auth_headers)
+    report = response.json()
+    # A quote inside an unquoted field is kept as it is
+    assert report["imported"] == 7
+    # An unclosed quote is reported once the record grows too long, and the import stops there
+    assert report["failed"] == 1
+    assert report["errors"][0]["line"] == 9
+    assert "unclosed quote" in report["errors"][0]["error"]
+    titles = [t["title"] for t in client.get("/tasks", headers=auth_headers).json()]
+    assert titles[0] == '5" screen'
+    assert len(titles) == 7
+
+
+# ============================================
+# ETAG TESTS
+# ============================================
+
+def test_read_tasks_conditional_get(auth_headers):
+    ids = _create_tasks(auth_headers, 2)
+    first = client.get("/tasks", headers=auth_headers)
+    etag = first.headers["etag"]
+
+    cached = client.get("/tasks", headers={**auth_headers, "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    # Other pages / filters are different representations
+    other = client.get("/tasks?limit=1", headers={**auth_headers, "If-None-Match": etag})
+    assert other.status_code == 200
+
+    client.patch(f"/tasks/{ids[0]}/status", json={"status": "completed"}, headers=auth_headers)
+    changed = client.get("/tasks", headers={**auth_headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
+def test_read_task_conditional_get(auth_headers):
+    ids = _create_tasks(auth_headers, 1)
+    etag = client.get(f"/tasks/{ids[0]}", headers=auth_headers).headers["etag"]
+    response = client.get(f"/tasks/{ids[0]}", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    client.request("DELETE", "/tasks", json={"ids": ids}, headers=auth_headers)
+    response = client.get(f"/tasks/{ids[0]}", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 404
+
+
+def test_etags_differ_between_users(auth_headers):
+    # Two accounts at the same version must not revalidate each other's cached copies
+    ids = _create_tasks(auth_headers, 1)
+    list_etag = client.get("/tasks", headers=auth_headers).headers["etag"]
+    task_etag = client.get(f"/tasks/{ids[0]}", headers=auth_headers).headers["etag"]
+
+    client.post("/register", json={"username": "bob", "email": "bob@example.com", "password": "bobpass123"})
+    token = client.post("/login", data={"username": "bob", "password": "bobpass123"}).json()["access_token"]
+    bob_headers = {"Authorization": f"Bearer {token}"}
+    _create_tasks(bob_headers, 1)
+
+    response = client.get("/tasks", headers={**bob_headers, "If-None-Match": list_etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != list_etag
+    response = client.get(f"/tasks/{ids[0]}", headers={**bob_headers, "If-None-Match": task_etag})
+    assert response.status_code == 404
+
+
+def test_read_task_wildcard_needs_existing_task(auth_headers):
+    ids = _create_tasks(auth_headers, 1)
+    response = client.get(f"/tasks/{ids[0]}", headers={**auth_headers, "If-None-Match": "*"})
+    assert response.status_code == 304
+    response = client.get("/tasks/99999", headers={**auth_headers, "If-None-Match": "*"})
+    assert response.status_code == 404
+
+
+# ============================================
+# EVENT STREAM TESTS
+# ============================================
+
+def _once_subscribed(hub, action):
+    # Runs action in the background once a stream has subscribed to the hub
+    import threading
+    import time
+
+    def run():
+        deadline = time.monotonic() + 10
+        while not hub._subscribers and time.monotonic() < deadline:
+            time.sleep(0.01)
+        action()
+    threading.Thread(target=run, daemon=True).start()
+
+
+def test_task_event_stream_replays_and_closes(auth_headers, monkeypatch):
+    import task_events
+    hub = task_events.TaskEventHub(history_size=10, queue_size=10)
+    monkeypatch.setattr(task_events, "hub", hub)
+    ids = _create_tasks(auth_headers, 1)
+    client.patch(f"/tasks/{ids[0]}/status", json={"status": "completed"}, headers=auth_headers)
+
+    # The stream only ends when the hub closes - close it once the client is connected
+    _once_subscribed(hub, hub.close)
+    token = auth_headers["Authorization"].split()[1]
+    response = client.get(
+        f"/tasks/events?access_token={token}",
+        headers={"Last-Event-ID": f"{hub.boot_id}-0"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    body = response.text
+    assert "event: created" in body
+    assert "event: updated" in body
+    assert '"status": "completed"' in body
+
+
+def test_task_event_stream_after_another_app_shut_down(tmp_path, monkeypatch):
+    import time
+    import task_events
+    from config import Settings
+    from main import create_app
+    hub = task_events.TaskEventHub(history_size=10, queue_size=10)
+    monkeypatch.setattr(task_events, "hub", hub)
+
+    app_settings = Settings(
+        database_url=f"sqlite:///{tmp_path / 'events.db'}", serve_frontend=False, sse_heartbeat_seconds=0.05
+    )
+    with TestClient(create_app(app_settings)):
+        pass
+    # The first app's shutdown closed the hub - a second app's stream stays open until the hub closes again
+    with TestClient(create_app(app_settings)) as second_client:
+        credentials = {"username": "streamer", "password": "streamerpass"}
+        second_client.post("/register", json={**credentials, "email": "streamer@example.com"})
+        token = second_client.post("/login", data=credentials).json()["access_token"]
+
+        def close_later():
+            time.sleep(0.3)
+            hub.close()
+        _once_subscribed(hub, close_later)
+        response = second_client.get(f"/tasks/events?access_token={token}")
+    assert response.status_code == 200
+    assert ": ping" in response.text
+
+
+def test_task_event_stream_requires_auth():
+    assert client.get("/tasks/events").status_code == 401
+
+
+def test_task_event_hub_resume():
+    import asyncio
+    import task_events
+
+    async def scenario():
+        hub = task_events.TaskEventHub(history_size=2, queue_size=10)
+        hub.publish(1, "created", {"ids": [1]})
+        hub.publish(2, "created", {"ids": [2]})
+        hub.publish(1, "deleted", {"ids": [1]})
+
+        _, replay = hub.subscribe(1, f"{hub.boot_id}-1")
+        assert [event.type for event in replay] == ["deleted"]
+        _, replay = hub.subscribe(1, "otherboot-1")
+        assert replay is None
+
+        # User 1's history holds two events - a third pushes the first one out
+        hub.publish(1, "created", {"ids": [3]})
+        _, replay = hub.subscribe(1, f"{hub.boot_id}-0")
+        assert replay is None
+
+        subscriber, _ = hub.subscribe(1, None)
+        hub.publish(1, "updated", {"ids": [3]})
+        event = await asyncio.wait_for(subscriber.queue.get(), timeout=1)
+        assert event.type == "updated"
+
+    asyncio.run(scenario())
+
+
+def test_task_event_hub_expires_idle_histories():
+    import asyncio
+    import task_events
+
+    async def scenario():
+        now = [0.0]
+        hub = task_events.TaskEventHub(history_size=10, queue_size=10, history_ttl=60, clock=lambda: now[0])
+        hub.publish(1, "created", {"ids": [1]})
+        subscriber, _ = hub.subscribe(2, None)
+        hub.publish(2, "created", {"ids": [2]})
+
+        # User 1 has no stream open - its history goes once idle for the ttl, user 2's stays
+        now[0] = 61
+        hub.publish(3, "created", {"ids": [3]})
+        assert set(hub._history) == {2, 3}
+        _, replay = hub.subscribe(1, f"{hub.boot_id}-0")
+        assert replay is None
+        # A new history of user 1 cannot replay what expired either
+        hub.publish(1, "updated", {"ids": [1]})
+        _, replay = hub.subscribe(1, f"{hub.boot_id}-0")
+        assert replay is None
+        hub.unsubscribe(2, subscriber)
+
+    asyncio.run(scenario())
+
+
+# ============================================
+# DELTA SYNC
+# ============================================
+
+def test_task_changes(auth_headers):
+    ids = _create_tasks(auth_headers, 3)
+    response = client.get("/tasks/changes", headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert [change["id"] for change in data["changes"]] == ids
+    assert data["has_more"] is False
+    checkpoint = data["since"]
+
+    # Nothing changed since the checkpoint
+    data = client.get(f"/tasks/changes?since={checkpoint}", headers=auth_headers).json()
+    assert data["changes"] == []
+    assert data["since"] == checkpoint
+
+    client.patch(f"/tasks/{ids[0]}/status", json={"status": "completed"}, headers=auth_headers)
+    client.delete(f"/tasks/{ids[1]}", headers=auth_headers)
+    data = client.get(f"/tasks/changes?since={checkpoint}", headers=auth_headers).json()
+    changes = {change["id"]: change for change in data["changes"]}
+    assert set(changes) == {ids[0], ids[1]}
+    assert changes[ids[0]]["status"] == "completed"
+    assert changes[ids[0]]["deleted"] is False
+    assert changes[ids[1]]["deleted"] is True
+    assert data["since"] > checkpoint
+
+    # The tombstone is gone from every other read
+    assert client.get(f"/tasks/{ids[1]}", headers=auth_headers).status_code == 404
+    assert client.delete(f"/tasks/{ids[1]}", headers=auth_headers).status_code == 404
+    assert [task["id"] for task in client.get("/tasks", headers=auth_headers).json()] == [ids[0], ids[2]]
+    assert client.get("/tasks/export", headers=auth_headers).text.count("\n") == 2
+
+
+def test_task_changes_pages_within_one_sequence(auth_headers):
+    # A bulk create stamps every row with the same sequence - after_id continues inside it
+    ids = _create_tasks(auth_headers, 5)
+    client.request("DELETE", "/tasks", json={"ids": ids}, headers=auth_headers)
+
+    seen, since, after_id = [], 0, None
+    while True:
+        url = f"/tasks/changes?since={since}&limit=2"
+        if after_id is not None:
+            url += f"&after_id={after_id}"
+        data = client.get(url, headers=auth_headers).json()
+        seen += [change["id"] for change in data["changes"]]
+        since, after_id = data["since"], data["after_id"]
+        if not data["has_more"]:
+            break
+    assert seen == ids
+    assert after_id is None
+
+
+def test_ensure_schema_adds_missing_columns(tmp_path):
+    from sqlalchemy import inspect, text
+    from database import ensure_schema
+
+    old_engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with old_engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE tasks (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, description VARCHAR,"
+            " status VARCHAR NOT NULL, due_date DATETIME NOT NULL, user_id INTEGER NOT NULL)"
+        ))
+    ensure_schema(old_engine)
+    inspector = inspect(old_engine)
+    assert {"change_seq", "deleted_at"} <= {column["name"] for column in inspector.get_columns("tasks")}
+    assert "ix_tasks_user_change_seq" in {index["name"] for index in inspector.get_indexes("tasks")}
+    old_engine.dispose()
+
+
+def test_ensure_schema_backfills_change_seq(tmp_path):
+    from sqlalchemy import text
+    from sqlalchemy.orm import Session
+    from database import ensure_schema
+    import db_interaction
+    import task_versions
+
+    old_engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with old_engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE tasks (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, description VARCHAR,"
+            " status VARCHAR NOT NULL, due_date DATETIME NOT NULL, user_id INTEGER NOT NULL)"
+        ))
+        connection.execute(text(
+            "INSERT INTO tasks (title, status, due_date, user_id) VALUES"
+            " ('Old', 'pending', '2030-01-01 00:00:00', 1), ('Other', 'pending', '2030-01-01 00:00:00', 2)"
+        ))
+    ensure_schema(old_engine)
+    with Session(old_engine) as db:
+        # The first sync of an upgraded database sees the tasks that were already there
+        changes = db_interaction.get_task_changes(db, 1, since=0, after_id=None, limit=10)
+        assert [task.title for task in changes] == ["Old"]
+        assert changes[0].change_seq == task_versions.current(db, 1) == 1
+    old_engine.dispose()
+
+
+# ============================================
+# SEARCH
+# ============================================
+
+def test_search_tasks_ranked(auth_headers):
+    due_date = (datetime.now() + timedelta(days=1)).isoformat()
+    tasks = [
+        {"title": "Call the dentist", "description": "Ask about the quarterly report"},
+        {"title": "Quarterly report", "description": "Numbers for Q3"},
+        {"title": "Buy milk", "description": None},
+    ]
+    ids = [
+        client.post("/tasks", json={**task, "status": "pending", "due_date": due_date}, headers=auth_headers).json()["id"]
+        for task in tasks
+    ]
+
+    response = client.get("/tasks/search?q=report", headers=auth_headers)
+    assert response.status_code == 200
+    # The title hit ranks above the description hit
+    assert [task["id"] for task in response.json()] == [ids[1], ids[0]]
+    assert "X-Next-Offset" not in response.headers
+
+    # Prefix match on every word, punctuation is not parsed as query syntax
+    assert [task["id"] for task in client.get("/tasks/search?q=quart q3", headers=auth_headers).json()] == [ids[1]]
+    assert client.get('/tasks/search?q="milk*(', headers=auth_headers).json()[0]["id"] == ids[2]
+    assert client.get("/tasks/search?q=--", headers=auth_headers).json() == []
+
+    response = client.get("/tasks/search?q=report&limit=1", headers=auth_headers)
+    assert response.headers["X-Next-Offset"] == "1"
+    response = client.get("/tasks/search?q=report&limit=1&offset=1", headers=auth_headers)
+    assert [task["id"] for task in response.json()] == [ids[0]]
+
+    # Deleted tasks are not found
+    client.delete(f"/tasks/{ids[1]}", headers=auth_headers)
+    assert [task["id"] for task in client.get("/tasks/search?q=report", headers=auth_headers).json()] == [ids[0]]
+
+
+def test_search_tasks_other_users_and_rebuild(auth_headers):
+    import task_search
+
+    _create_tasks(auth_headers, 3)
+    client.post("/register", json={"username": "other", "email": "other@example.com", "password": "otherpass123"})
+    token = client.post("/login", data={"username": "other", "password": "otherpass123"}).json()["access_token"]
+    assert client.get("/tasks/search?q=task", headers={"Authorization": f"Bearer {token}"}).json() == []
+
+    with engine.begin() as connection:
+        task_search.rebuild(connection)
+    assert len(client.get("/tasks/search?q=task", headers=auth_headers).json()) == 3
+
+
+# ============================================
+# STATS
+# ============================================
+
+def test_task_stats(auth_headers):
+    today = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+    due_dates = [today - timedelta(days=2), today - timedelta(days=1), today, today, today + timedelta(days=3)]
+    ids = [
+        client.post(
+            "/tasks",
+            json={"title": f"Task {i}", "status": "pending", "due_date": due.isoformat()},
+            headers=auth_headers
+        ).json()["id"]
+        for i, due in enumerate(due_dates)
+    ]
+    client.post(
+        "/tasks/bulk",
+        json=[{"title": "Bulk", "status": "in_progress", "due_date": today.isoformat()}] * 2,
+        headers=auth_headers
+    )
+
+    response = client.get(f"/tasks/stats?today={today.date().isoformat()}", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json() == {
+        "total": 7,
+        "by_status": {"pending": 5, "in_progress": 2, "completed": 0},
+        "overdue": 2,
+        "due_today": 4,
+        "today": today.date().isoformat(),
+    }
+
+    # Completed tasks are no longer overdue, deleted tasks are not counted
+    client.patch(f"/tasks/{ids[0]}/status", json={"status": "completed"}, headers=auth_headers)
+    client.patch("/tasks/status", json={"status": "completed", "filter": {"status": "in_progress"}}, headers=auth_headers)
+    client.delete(f"/tasks/{ids[2]}", headers=auth_headers)
+    client.request("DELETE", "/tasks", json={"ids": [ids[4]]}, headers=auth_headers)
+    data = client.get(f"/tasks/stats?today={today.date().isoformat()}", headers=auth_headers).json()
+    assert data["by_status"] == {"pending": 2, "in_progress": 0, "completed": 3}
+    assert data["total"] == 5
+    assert data["overdue"] == 1
+    assert data["due_today"] == 1
+
+
+def test_task_counters_recompute(auth_headers):
+    import task_counters
+    from sqlalchemy import select
+
+    _create_tasks(auth_headers, 4)
+    client.patch("/tasks/status", json={"status": "completed", "filter": {"due_after": datetime.now().isoformat()}}, headers=auth_headers)
+    client.delete("/tasks/1", headers=auth_headers)
+    counters = task_counters.counters
+    with engine.connect() as connection:
+        maintained = set(connection.execute(select(counters)).all())
+    with engine.begin() as connection:
+        task_counters.recompute(connection)
+    with engine.connect() as connection:
+        assert set(connection.execute(select(counters)).all()) == maintained
+        assert sum(row.count for row in maintained) == 3
+
+    # An empty counters table next to existing tasks is filled on startup
+    with engine.begin() as connection:
+        connection.execute(counters.delete())
+        task_counters.ensure_counters(connection)
+    with engine.connect() as connection:
+        assert set(connection.execute(select(counters)).all()) == maintained
+
+
+# ============================================
+# FAST JSON PATH
+# ============================================
+
+def test_task_list_fast_path_matches_response_model(auth_headers):
+    ids = _create_tasks(auth_headers, 3)
+    client.post(
+        "/tasks",
+        json={"title": "Ünïcode \"quoted\"", "description": "line\nbreak", "status": "in_progress",
+              "due_date": "2030-01-02T03:04:05.678000"},
+        headers=auth_headers
+    )
+    response = client.get("/tasks", headers=auth_headers)
+    assert response.headers["content-type"] == "application/json"
+    listed = response.json()
+    # Same fields, order and values as the response_model path used by GET /tasks/{task_id}
+    assert [list(task) for task in listed] == [list(schemas.Task.model_fields)] * 4
+    assert listed == [client.get(f"/tasks/{task['id']}", headers=auth_headers).json() for task in listed]
+    assert [task["id"] for task in listed][:3] == ids
+
+    # The OpenAPI schema still documents a list of tasks
+    schema = app.openapi()["paths"]["/tasks"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+    assert schema == {"type": "array", "items": {"$ref": "#/components/schemas/Task"}, "title": "Response Read Tasks Tasks Get"}
+
+
+# ============================================
+# SINGLE-ROUND-TRIP WRITES
+# ============================================
+
+def test_single_task_writes_use_returning(auth_headers):
+    from sqlalchemy import event
+
+    task_id = _create_tasks(auth_headers, 1)[0]
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith(("BEGIN", "COMMIT", "ROLLBACK")):
+            statements.append(statement.split()[0])
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        # The version bump plus one write each - no SELECT before, no refresh after
+        response = client.patch(f"/tasks/{task_id}/status", json={"status": "completed"}, headers=auth_headers)
+        assert response.json()["status"] == "completed"
+        assert statements == ["UPDATE", "UPDATE"]
+
+        statements.clear()
+        response = client.post(
+            "/tasks",
+            json={"title": "New", "status": "pending", "due_date": "2030-01-01T00:00:00"},
+            headers=auth_headers
+        )
+        assert response.status_code == 201
+        assert response.json()["title"] == "New"
+        assert statements == ["UPDATE", "INSERT"]
+
+        statements.clear()
+        assert client.delete(f"/tasks/{task_id}", headers=auth_headers).status_code == 200
+        assert statements == ["UPDATE", "UPDATE"]
+        assert client.delete(f"/tasks/{task_id}", headers=auth_headers).status_code == 404
+        assert client.patch(f"/tasks/{task_id}/status", json={"status": "pending"}, headers=auth_headers).status_code == 404
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+# ============================================
+# BENCHMARK HARNESS
+# ============================================
+
+def test_benchmark_percentiles_and_baseline_compare():
+    import benchmark
+
+    latencies = [i / 1000 for i in range(1, 101)]  # 1 .. 100 ms
+    summary = benchmark.summarize(latencies, errors=0, duration=2.0)
+    assert summary["requests"] == 100
+    assert summary["throughput_rps"] == 50.0
+    assert (summary["p50_ms"], summary["p95_ms"], summary["p99_ms"]) == (50.0, 95.0, 99.0)
+
+    baseline = {"scenarios": {"list_reads": summary}}
+    same = {"scenarios": {"list_reads": dict(summary, p99_ms=110.0)}}
+    assert benchmark.compare(same, baseline, tolerance=0.2) == []
+    slower = {"scenarios": {"list_reads": dict(summary, throughput_rps=30.0, p95_ms=200.0, errors=1)}}
+    regressions = benchmark.compare(slower, baseline, tolerance=0.2)
+    assert len(regressions) == 3
+    assert all(regression.startswith("list_reads:") for regression in regressions)
+    # Scenarios missing from the baseline are not compared
+    assert benchmark.compare({"scenarios": {"login_storm": summary}}, baseline, tolerance=0.2) == []
+
+
+# ============================================
+# METRICS
+# ============================================
+
+def test_metrics_endpoint(auth_headers):
+    import metrics
+
+    task_id = _create_tasks(auth_headers, 1)[0]
+    before = metrics.http_requests.value(method="GET", route="/tasks/{task_id}", status="200")
+    queries_before = metrics.db_query_duration.count(operation="SELECT")
+    client.get(f"/tasks/{task_id}", headers=auth_headers)
+    client.get("/tasks/999999", headers=auth_headers)
+    # Labelled by route template, not by raw path
+    assert metrics.http_requests.value(method="GET", route="/tasks/{task_id}", status="200") == before + 1
+    assert metrics.http_requests.value(method="GET", route="/tasks/{task_id}", status="404") >= 1
+    assert metrics.http_request_duration.count(method="GET", route="/tasks/{task_id}") >= 2
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/tasks/{task_id}",status="200"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/tasks/{task_id}",le="+Inf"}' in body
+    assert 'http_requests_in_progress{method="GET"} 1' in body
+    assert '# TYPE password_hashing_duration_seconds histogram' in body
+    assert 'password_hashing_duration_seconds_count{operation="hash"}' in body
+    assert "/tasks/999999" not in body
+
+
+def test_metrics_db_and_pool_instrumentation(tmp_path):
+    import metrics
+    from sqlalchemy import text
+    from database import TimedQueuePool, instrument_engine
+
+    file_engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}", poolclass=TimedQueuePool)
+    instrument_engine(file_engine)
+    selects = metrics.db_query_duration.count(operation="SELECT")
+    checkouts = metrics.db_pool_checkout.count()
+    with file_engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        with pytest.raises(Exception):
+            connection.execute(text("SELECT * FROM missing_table"))
+        connection.execute(text("SELECT 2"))
+    assert metrics.db_query_duration.count(operation="SELECT") == selects + 2
+    assert metrics.db_pool_checkout.count() == checkouts + 1
+    file_engine.dispose()
+
+
+def test_metrics_async_pool_instrumentation(tmp_path):
+    import metrics
+    from config import Settings
+    from main import create_app
+
+    async_app = create_app(Settings(
+        database_url=f"sqlite:///{tmp_path / 'async_metrics.db'}", async_db=True, serve_frontend=False
+    ))
+    with TestClient(async_app) as async_app_client:
+        checkouts = metrics.db_pool_checkout.count()
+        response = async_app_client.post(
+            "/register", json={"username": "asyncpool", "email": "asyncpool@example.com", "password": "asyncpass"}
+        )
+        assert response.status_code == 201
+        assert metrics.db_pool_checkout.count() > checkouts
+
+
+def test_metrics_histogram_rendering():
+    import metrics
+
+    histogram = metrics.Histogram("demo_seconds", "Demo", ("kind",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, kind="a")
+    histogram.observe(0.5, kind="a")
+    histogram.observe(5, kind="a")
+    assert histogram.render() == [
+        "# HELP demo_seconds Demo",
+        "# TYPE demo_seconds histogram",
+        'demo_seconds_bucket{kind="a",le="0.1"} 1',
+        'demo_seconds_bucket{kind="a",le="1.0"} 2',
+        'demo_seconds_bucket{kind="a",le="+Inf"} 3',
+        'demo_seconds_sum{kind="a"} 5.55',
+        'demo_seconds_count{kind="a"} 3',
+    ]
+
+
+# ============================================
+# QUERY BUDGETS
+# ============================================
+
+def test_query_budgets(auth_headers):
+    task_ids = _create_tasks(auth_headers, 3)
+    # Budgets per endpoint - a lazy load or an extra lookup sneaking in fails here
+    with query_budget.max_queries(2):
+        response = client.get("/tasks", headers=auth_headers)
+    assert response.headers["server-timing"].endswith('desc="2 queries"')
+    with query_budget.max_queries(2):
+        client.get(f"/tasks/{task_ids[0]}", headers=auth_headers)
+    with query_budget.max_queries(2):
+        client.patch(f"/tasks/{task_ids[0]}/status", json={"status": "completed"}, headers=auth_headers)
+    with query_budget.max_queries(2):
+        client.delete(f"/tasks/{task_ids[1]}", headers=auth_headers)
+    with query_budget.max_queries(1):
+        client.get("/tasks/stats", headers=auth_headers)
+    # Principal cache miss - one user lookup
+    principal_cache.cache.clear()
+    with query_budget.max_queries(1):
+        client.get("/users/me", headers=auth_headers)
+
+    with pytest.raises(query_budget.QueryBudgetExceeded, match=r"GET /tasks ran 2 queries, budget is 1"):
+        with query_budget.max_queries(1):
+            client.get("/tasks", headers=auth_headers)
+
+
+def test_query_budget_n_plus_one_and_slow_query_log(monkeypatch, caplog):
+    from fastapi import FastAPI
+    from sqlalchemy import select, text
+    from config import settings
+    from models import Task
+
+    db = TestingSessionLocal()
+    users = [User(username=f"user{i}", email=f"user{i}@example.com", hashed_password="x") for i in range(4)]
+    db.add_all(users)
+    db.commit()
+    db.add_all(Task(title=f"Task {i}", description="", status="pending", due_date=datetime.now(), user_id=user.id)
+               for i, user in enumerate(users))
+    db.commit()
+    db.close()
+
+    n_plus_one = FastAPI()
+
+    @n_plus_one.get("/owners")
+    def owners():
+        session = TestingSessionLocal()
+        try:
+            # One lazy load of Task.owner per task
+            return [task.owner.username for task in session.scalars(select(Task))]
+        finally:
+            session.close()
+
+    monkeypatch.setattr(settings, "n_plus_one_threshold", 2)
+    monkeypatch.setattr(settings, "slow_query_ms", 0.000001)
+    with caplog.at_level("WARNING", logger="taskmanager.queries"):
+        with query_budget.max_queries(5) as finished:
+            TestClient(query_budget.QueryBudgetMiddleware(n_plus_one)).get("/owners")
+    assert finished[0][2].count == 5
+    assert "possible N+1 in GET /owners: statement ran 4 times: SELECT users." in caplog.text
+    # Slow statements are logged with their plan
+    assert "slow query" in caplog.text and "SEARCH users USING INTEGER PRIMARY KEY" in caplog.text
+
+    # No request in flight - statements are not accounted, but still logged when slow
+    caplog.clear()
+    with caplog.at_level("WARNING", logger="taskmanager.queries"):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT count(*) FROM tasks"))
+    assert query_budget.current() is None
+    assert "SELECT count(*) FROM tasks" in caplog.text
+
+
+# ============================================
+# PROFILING
+# ============================================
+
+def test_profiling_middleware(monkeypatch, tmp_path, auth_headers):
+    import time
+    from fastapi import FastAPI
+    from config import settings
+    import profiling
+
+    monkeypatch.setattr(settings, "profile_token", "secret")
+    monkeypatch.setattr(settings, "profile_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "profile_keep", 2)
+    monkeypatch.setattr(settings, "profile_interval_ms", 1.0)
+
+    busy = FastAPI()
+
+    @busy.get("/busy/{n}")
+    def spin(n: int):
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        return n
+
+    busy_client = TestClient(profiling.ProfilingMiddleware(busy))
+    # No or wrong token, no sampling - nothing is written
+    busy_client.get("/busy/1")
+    busy_client.get("/busy/1", headers={"X-Profile": "guess"})
+    assert list(tmp_path.iterdir()) == []
+
+    assert busy_client.get("/busy/1", headers={"X-Profile": "secret"}).json() == 1
+    [profile] = tmp_path.iterdir()
+    assert profile.name.endswith(".collapsed") and "_GET_busy_n_" in profile.name
+    lines = profile.read_text().splitlines()
+    # Collapsed stacks - the sync route ran in a worker thread and was sampled there
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any(line.rsplit(" ", 1)[0].endswith("unit_test_main:spin") for line in lines)
+
+    # Sampling rate, on the real app - route templates in the name, only the newest profile_keep kept
+    monkeypatch.setattr(settings, "profile_sample_rate", 1.0)
+    app_client = TestClient(profiling.ProfilingMiddleware(app))
+    app_client.get("/tasks", headers=auth_headers)
+    time.sleep(0.01)
+    app_client.get("/tasks/1", headers=auth_headers)
+    names = sorted(path.name for path in tmp_path.iterdir())
+    assert len(names) == 2
+    assert "_GET_tasks_" in names[0] and "_task_id_" not in names[0]
+    assert "_GET_tasks_task_id_" in names[1]
+
+
+# ============================================
+# STARTUP
+# ============================================
+
+def test_import_main_does_not_touch_the_database(tmp_path):
+    import os
+    import subprocess
+    import sys
+
+    database_file = tmp_path / "startup.db"
+    code = (
+        "import sys, main; "
+        "print(sorted(name for name in ('jose', 'async_routes', 'profiling') if name in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={**os.environ, "TASKMANAGER_DATABASE_URL": f"sqlite:///{database_file}"},
+        capture_output=True, text=True, check=True,
+    )
+    assert not database_file.exists()
+    # Rarely needed modules are imported on first use
+    assert result.stdout.split("\n")[-2] == "[]"
+
+
+def test_create_app_and_init_db(tmp_path):
+    from sqlalchemy import inspect
+    from config import Settings
+    from database import init_db
+    from main import create_app
+
+    def has_metrics(application):
+        return any(getattr(route, "path", None) == "/metrics" for route in application.routes)
+
+    assert has_metrics(app)
+    assert not has_metrics(create_app(Settings(metrics_enabled=False)))
+    async_app = create_app(Settings(async_db=True, init_db_on_startup=False))
+    assert async_app.state.settings.init_db_on_startup is False
+    # Shared routes come first, so /tasks/export is not taken for a task id
+    paths = list(async_app.openapi()["paths"])
+    assert paths.index("/tasks/export") < paths.index("/tasks/{task_id}")
+
+    file_engine = create_engine(f"sqlite:///{tmp_path / 'init.db'}")
+    init_db(file_engine)
+    init_db(file_engine)
+    inspector = inspect(file_engine)
+    assert {"users", "tasks", "task_counters", "tasks_fts"} <= set(inspector.get_table_names())
+    with file_engine.connect() as connection:
+        triggers = connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'trigger'").scalars().all()
+    assert "task_counters_insert" in triggers
+    file_engine.dispose()
+
+
+# ============================================
+# FRONTEND STATIC ASSETS
+# ============================================
+
+def test_static_assets_build_and_serve(tmp_path):
+    import json
+    import os
+    import static_assets
+    from config import Settings
+    from main import create_app
+
+    source = tmp_path / "frontend"
+    (source / "js").mkdir(parents=True)
+    (source / "home.html").write_text(
+        '<link rel="stylesheet" href="home.css"><script src="js/app.js"></script>'
+        '<a href="tasks.html">Tasks</a>' + "<p>padding</p>" * 50
+    )
+    (source / "home.css").write_text("body { color: black; }\n" * 50)
+    (source / "js" / "app.js").write_text("console.log('tiny');")
+    build_dir = tmp_path / "build"
+    manifest = static_assets.build(str(source), str(build_dir))
+
+    css = manifest["assets"]["home.css"]
+    assert css.startswith("home.") and css.endswith(".css") and css != "home.css"
+    page = (build_dir / manifest["build"] / "home.html").read_text()
+    assert f'href="{css}"' in page and f'src="{manifest["assets"]["js/app.js"]}"' in page
+    assert 'href="tasks.html"' in page
+    # Compressed only where it saves something
+    assert manifest["encodings"][css] == ["gzip"] or manifest["encodings"][css] == ["br", "gzip"]
+    assert manifest["encodings"][manifest["assets"]["js/app.js"]] == []
+
+    frontend_client = TestClient(create_app(Settings(frontend_build_dir=str(build_dir))))
+    response = frontend_client.get("/", follow_redirects=False)
+    assert response.status_code == 307 and response.headers["location"] == "/app/home.html"
+
+    response = frontend_client.get("/app/home.html", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("text/html")
+    assert response.headers["cache-control"] == "no-cache"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.text == page
+    gzip_etag = response.headers["etag"]
+    assert gzip_etag == manifest["etags"]["home.html:gzip"]
+    # Repeat visit - revalidated for free
+    response = frontend_client.get("/app/home.html", headers={"Accept-Encoding": "gzip", "If-None-Match": gzip_etag})
+    assert response.status_code == 304
+
+    response = frontend_client.get("/app/home.html", headers={"Accept-Encoding": "gzip;q=0, identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] != gzip_etag and response.text == page
+
+    response = frontend_client.get(f"/app/{css}", headers={"Accept-Encoding": "gzip, deflate"})
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert response.headers["content-type"].startswith("text/css")
+    assert frontend_client.get("/app/missing.html").status_code == 404
+    assert frontend_client.post("/app/home.html").status_code == 405
+
+    # Rebuilt only when a source is newer than the build
+    built_at = (build_dir / "manifest.json").stat().st_mtime
+    os.utime(build_dir / "manifest.json", (built_at + 10, built_at + 10))
+    static_assets.ensure_built(str(source), str(build_dir))
+    assert (build_dir / "manifest.json").stat().st_mtime == built_at + 10
+    (source / "home.css").write_text("body { color: red; }\n" * 50)
+    os.utime(source / "home.css", (built_at + 20, built_at + 20))
+    static_assets.ensure_built(str(source), str(build_dir))
+    assert json.loads((build_dir / "manifest.json").read_text())["assets"]["home.css"] != css
+
+
+def test_static_assets_concurrent_builds(tmp_path):
+    import static_assets
+
+    source = tmp_path / "frontend"
+    source.mkdir()
+    (source / "home.html").write_text("<p>home</p>" * 50)
+    build_dir = tmp_path / "build"
+    build_dir.mkdir()
+    (build_dir / "home.html").write_text("left over from an older layout")
+
+    # Workers starting together build the same content - the later ones reuse the first build
+    first = static_assets.build(str(source), str(build_dir))
+    second = static_assets.build(str(source), str(build_dir))
+    assert first == second
+    assert sorted(path.name for path in build_dir.iterdir()) == sorted([first["build"], "manifest.json"])
+
+    # Older builds are kept for workers that have not switched yet, up to KEEP_BUILDS
+    builds = [first["build"]]
+    for version in range(static_assets.KEEP_BUILDS + 1):
+        (source / "home.html").write_text(f"<p>version {version}</p>" * 50)
+        builds.append(static_assets.build(str(source), str(build_dir))["build"])
+    remaining = {path.name for path in build_dir.iterdir()} - {"manifest.json"}
+    assert builds[-1] in remaining and len(remaining) == static_assets.KEEP_BUILDS + 1
+
+
+def test_accepted_encodings():
+    import static_assets
+
+    assert static_assets.accepted_encodings("gzip, deflate, br") == {"gzip", "deflate", "br"}
+    assert static_assets.accepted_encodings("br;q=0, gzip;q=0.5") == {"gzip"}
+    assert static_assets.accepted_encodings("") == set()
+
+
+# ============================================
+# RESPONSE COMPRESSION
+# ============================================
+
+def test_compression_of_task_lists(auth_headers):
+    _create_tasks(auth_headers, 60)
+    response = client.get("/tasks?limit=100", headers={**auth_headers, "Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()) == 60
+    # Repetitive JSON - the wire size is a fraction of the payload
+    assert response.num_bytes_downloaded * 4 < len(response.content)
+    # Weak ETag for the compressed representation, still good for a 304
+    etag = response.headers["etag"]
+    assert etag.startswith("W/")
+    revalidated = client.get("/tasks?limit=100", headers={**auth_headers, "Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert revalidated.status_code == 304
+
+    response = client.get("/tasks?limit=100", headers={**auth_headers, "Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["vary"]
+    # Below the minimum size
+    response = client.get("/users/me", headers={**auth_headers, "Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+
+def test_compression_middleware_content_types():
+    import gzip
+    from fastapi import FastAPI
+    from fastapi.responses import Response, StreamingResponse
+    import compression
+
+    demo = FastAPI()
+    line = b'{"title": "Task", "status": "pending"}\n'
+
+    @demo.get("/export")
+    def export():
+        return StreamingResponse(iter([line] * 200), media_type="application/x-ndjson")
+
+    @demo.get("/events")
+    def events():
+        return StreamingResponse(iter([b"data: x\n\n"] * 200), media_type="text/event-stream")
+
+    @demo.get("/image")
+    def image():
+        return Response(b"\x89PNG" + b"\x00" * 5000, media_type="image/png")
+
+    @demo.get("/encoded")
+    def encoded():
+        return Response(gzip.compress(line * 100), media_type="text/plain", headers={"Content-Encoding": "gzip"})
+
+    demo_client = TestClient(compression.CompressionMiddleware(demo, minimum_size=100))
+    headers = {"Accept-Encoding": "gzip"}
+    response = demo_client.get("/export", headers=headers)
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.content == line * 200
+    for path in ("/events", "/image"):
+        assert "content-encoding" not in demo_client.get(path, headers=headers).headers
+    # Already encoded - passed through, not compressed twice
+    response = demo_client.get("/encoded", headers=headers)
+    assert response.headers["content-encoding"] == "gzip" and response.content == line * 100
+
+    assert compression.is_compressible("application/json; charset=utf-8")
+    assert compression.is_compressible("application/problem+json")
+    assert not compression.is_compressible("text/event-stream")
+    available = compression.codecs(3, 5, 6)
+    assert compression.choose_encoding("br;q=0, gzip", available) == "gzip"
+    assert compression.choose_encoding("identity", available) is None
+
+
+# ============================================
+# RATE LIMITING
+# ============================================
+
+def test_token_buckets():
+    buckets = rate_limit.TokenBuckets(capacity=2, period=10, maxsize=2)
+    assert buckets.take("a", now=0) == 0
+    assert buckets.take("a", now=0) == 0
+    # Empty - one token every 5 seconds
+    assert buckets.take("a", now=1) == pytest.approx(4.0)
+    assert buckets.take("a", now=5) == 0
+    # Least recently used buckets are dropped beyond maxsize - "a" starts full again
+    buckets.take("b", now=5)
+    buckets.take("c", now=5)
+    assert len(buckets) == 2
+    assert buckets.take("a", now=5) == 0
+
+    assert rate_limit.parse_limit("10/minute") == (10, 60.0)
+    assert rate_limit.parse_limit("") is None
+    with pytest.raises(ValueError):
+        rate_limit.parse_limit("10/fortnight")
+
+
+def test_rate_limited_login_register_and_task_creation(monkeypatch, test_user, auth_headers):
+    from config import Settings
+
+    limiters = app.state.rate_limiters
+    monkeypatch.setitem(limiters, "login_username", rate_limit.RateLimiter("login_username", "2/minute", 100))
+    monkeypatch.setitem(limiters, "register_ip", rate_limit.RateLimiter("register_ip", "1/hour", 100))
+    monkeypatch.setitem(limiters, "create_task_user", rate_limit.RateLimiter("create_task_user", "2/minute", 100))
+
+    wrong = {"username": "TestUser", "password": "wrong"}
+    assert client.post("/login", data=wrong).status_code == 401
+    assert client.post("/login", data=wrong).status_code == 401
+    # Usernames are limited case-insensitively - the right password does not help now
+    response = client.post("/login", data={"username": "testuser", "password": "testpass123"})
+    assert response.status_code == 429
+    assert 0 < int(response.headers["retry-after"]) <= 30
+    # Another username from the same client is not affected
+    assert client.post("/login", data={"username": "someone", "password": "x"}).status_code == 401
+
+    assert client.post("/register", json={"username": "u1", "email": "u1@example.com", "password": "secret123"}).status_code == 201
+    response = client.post("/register", json={"username": "u2", "email": "u2@example.com", "password": "secret123"})
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) == 3600
+
+    task = {"title": "Task", "status": "pending", "due_date": (datetime.now() + timedelta(days=1)).isoformat()}
+    assert client.post("/tasks", json=task, headers=auth_headers).status_code == 201
+    assert client.post("/tasks", json=task, headers=auth_headers).status_code == 201
+    assert client.post("/tasks", json=task, headers=auth_headers).status_code == 429
+    # Reads are not limited
+    assert client.get("/tasks", headers=auth_headers).status_code == 200
+
+    # Bulk creates and imports share a limit of their own, per call rather than per row
+    monkeypatch.setitem(limiters, "bulk_task_user", rate_limit.RateLimiter("bulk_task_user", "2/minute", 100))
+    assert client.post("/tasks/bulk", json=[task] * 50, headers=auth_headers).status_code == 201
+    import_body = f"title,status,due_date\nImported,pending,{task['due_date']}\n"
+    assert client.post("/tasks/import?format=csv", content=import_body, headers=auth_headers).status_code == 200
+    assert client.post("/tasks/bulk", json=[task], headers=auth_headers).status_code == 429
+    assert client.post("/tasks/import?format=csv", content=import_body, headers=auth_headers).status_code == 429
+
+    disabled = rate_limit.build_limiters(Settings(rate_limit_enabled=False, rate_limit_create_task_user="1/hour"))
+    monkeypatch.setitem(limiters, "create_task_user", disabled["create_task_user"])
+    assert client.post("/tasks", json=task, headers=auth_headers).status_code == 201
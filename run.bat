@@ -13,7 +13,7 @@ echo.
 echo Opening Application in Browser...
 cd ..
 echo start by clicking on the link
-echo chrome "http://localhost:63342/API_Taskmanager/frontend/home.html"
+echo chrome "http://localhost:8000/app/home.html"
 echo.
 echo ========================================
 echo Application Started!